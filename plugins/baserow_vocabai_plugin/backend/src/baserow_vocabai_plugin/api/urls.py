@@ -1,6 +1,6 @@
 from django.urls import re_path
 
-from .views import CloudLanguageToolsLanguageList, CloudLanguageToolsTranslationOptions, CloudLanguageToolsTransliterationOptions, CloudLanguageToolsTranslationServices, CloudLanguageToolsDictionaryLookupOptions
+from .views import CloudLanguageToolsLanguageList, CloudLanguageToolsTranslationOptions, CloudLanguageToolsTransliterationOptions, CloudLanguageToolsTranslationServices, CloudLanguageToolsDictionaryLookupOptions, CloudLanguageToolsLanguageTransliterationOptions, CloudLanguageToolsLanguageDictionaryLookupOptions
 
 app_name = "baserow_vocabai_plugin.api"
 
@@ -9,5 +9,7 @@ urlpatterns = [
     re_path(r"translation_options/$", CloudLanguageToolsTranslationOptions.as_view(), name="translation-options"),
     re_path(r"transliteration_options/$", CloudLanguageToolsTransliterationOptions.as_view(), name="list"),
     re_path(r"dictionary_lookup_options/$", CloudLanguageToolsDictionaryLookupOptions.as_view(), name="list"),
+    re_path(r"transliteration_options/(?P<language>[a-z_]+)/$", CloudLanguageToolsLanguageTransliterationOptions.as_view(), name="language-transliteration-options"),
+    re_path(r"dictionary_lookup_options/(?P<language>[a-z_]+)/$", CloudLanguageToolsLanguageDictionaryLookupOptions.as_view(), name="language-dictionary-lookup-options"),
     re_path(r"translation_services/(?P<source_language>[a-z_]+)/(?P<target_language>[a-z_]+)/$", CloudLanguageToolsTranslationServices.as_view(), name="list"),
 ]
@@ -5,6 +5,13 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import permission_classes as method_permission_classes
 from drf_spectacular.openapi import OpenApiParameter, OpenApiTypes
 from baserow.contrib.database.api.tokens.authentications import TokenAuthentication
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+import datetime
+import gzip
+import hashlib
+import json
 import logging
 
 
@@ -14,6 +21,70 @@ from ..cloudlanguagetools import tasks
 
 logger = logging.getLogger(__name__)
 
+# the language data only changes when it gets refreshed, clients revalidate with the ETag after this
+LANGUAGE_DATA_CACHE_CONTROL = 'public, max-age=3600'
+
+# serialized (plain and gzipped) response bodies, built once per language data version
+response_body_cache = {}
+
+def get_response_bodies(name, get_data, version):
+    global response_body_cache
+    key = (version, name)
+    if key not in response_body_cache:
+        # drop bodies from previous versions
+        response_body_cache = {k: v for k, v in response_body_cache.items() if k[0] == version}
+        body = json.dumps(get_data()).encode('utf-8')
+        response_body_cache[key] = {
+            'identity': body,
+            'gzip': gzip.compress(body)
+        }
+    return response_body_cache[key]
+
+def accepts_gzip(request):
+    """whether the client accepts a gzip body, going by the q-values of Accept-Encoding. gzip;q=0 refuses it,
+    and * covers gzip when it isn't listed"""
+    qvalues = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if coding == '':
+            continue
+        qvalue = 1.0
+        for param in params:
+            param_name, _, param_value = param.partition('=')
+            if param_name.strip().lower() == 'q':
+                try:
+                    qvalue = float(param_value.strip())
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+    for coding in ['gzip', 'x-gzip', '*']:
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+def language_data_response(request, name, get_data):
+    """cacheable response for language data, supports ETag / Last-Modified revalidation and gzip"""
+    version = clt_interface.get_language_data_version()
+    etag = '"' + hashlib.md5(f'{name}:{version}'.encode('utf-8')).hexdigest() + '"'
+    last_modified = int(datetime.datetime.fromisoformat(version).timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response == None:
+        bodies = get_response_bodies(name, get_data, version)
+        if accepts_gzip(request):
+            response = HttpResponse(bodies['gzip'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(bodies['identity'], content_type='application/json')
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = LANGUAGE_DATA_CACHE_CONTROL
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
 class CloudLanguageToolsLanguageList(APIView):
     authentication_classes = APIView.authentication_classes + [TokenAuthentication]
     permission_classes = (IsAuthenticated,)
@@ -33,8 +104,7 @@ class CloudLanguageToolsLanguageList(APIView):
     )
     @method_permission_classes([AllowAny])
     def get(self, request):
-        language_data = clt_interface.get_language_list()
-        return Response(language_data)
+        return language_data_response(request, 'language_list', clt_interface.get_language_list)
 
 
 class CloudLanguageToolsTranslationOptions(APIView):
@@ -56,8 +126,7 @@ class CloudLanguageToolsTranslationOptions(APIView):
     )
     @method_permission_classes([AllowAny])
     def get(self, request):
-        language_data = clt_interface.get_translation_options()
-        return Response(language_data)
+        return language_data_response(request, 'translation_options', clt_interface.get_translation_options)
 
 
 class CloudLanguageToolsTransliterationOptions(APIView):
@@ -79,8 +148,7 @@ class CloudLanguageToolsTransliterationOptions(APIView):
     )
     @method_permission_classes([AllowAny])
     def get(self, request):
-        language_data = clt_interface.get_transliteration_options()
-        return Response(language_data)
+        return language_data_response(request, 'transliteration_options', clt_interface.get_transliteration_options)
 
 class CloudLanguageToolsDictionaryLookupOptions(APIView):
     authentication_classes = APIView.authentication_classes + [TokenAuthentication]
@@ -101,8 +169,105 @@ class CloudLanguageToolsDictionaryLookupOptions(APIView):
     )
     @method_permission_classes([AllowAny])
     def get(self, request):
-        language_data = clt_interface.get_dictionary_lookup_options()
-        return Response(language_data)        
+        return language_data_response(request, 'dictionary_lookup_options', clt_interface.get_dictionary_lookup_options)        
+
+FILTERED_OPTIONS_PARAMETERS = [
+    OpenApiParameter(
+        name="language",
+        location=OpenApiParameter.PATH,
+        type=OpenApiTypes.STR,
+        description="language code of the source field",
+    ),
+    OpenApiParameter(
+        name="service",
+        location=OpenApiParameter.QUERY,
+        type=OpenApiTypes.STR,
+        description="only return options for this service",
+    ),
+    OpenApiParameter(
+        name="search",
+        location=OpenApiParameter.QUERY,
+        type=OpenApiTypes.STR,
+        description="only return options with a word in their name starting with this prefix",
+    ),
+    OpenApiParameter(
+        name="offset",
+        location=OpenApiParameter.QUERY,
+        type=OpenApiTypes.INT,
+        description="number of options to skip",
+    ),
+    OpenApiParameter(
+        name="limit",
+        location=OpenApiParameter.QUERY,
+        type=OpenApiTypes.INT,
+        description="maximum number of options to return, all of them if not specified",
+    ),
+]
+
+def filtered_options_response(request, options):
+    """paginate options according to the offset / limit query parameters"""
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = request.GET.get('limit', None)
+        limit = max(int(limit), 0) if limit != None else None
+    except ValueError:
+        return Response({'error': 'offset and limit must be integers'}, status=400)
+    end = offset + limit if limit != None else None
+    return Response({
+        'count': len(options),
+        'results': options[offset:end]
+    })
+
+
+class CloudLanguageToolsLanguageTransliterationOptions(APIView):
+    authentication_classes = APIView.authentication_classes + [TokenAuthentication]
+    permission_classes = (IsAuthenticated,)
+
+    def get_permissions(self):
+        if self.request.method == "GET":
+            return [AllowAny()]
+
+        return super().get_permissions()
+
+    @extend_schema(
+        parameters=FILTERED_OPTIONS_PARAMETERS,
+        tags=["cloudlanguagetools language data"],
+        operation_id="language_transliteration_options",
+        description=(
+            "Retrieve the transliteration options for a language, optionally filtered by service and name prefix"
+        ),
+    )
+    @method_permission_classes([AllowAny])
+    def get(self, request, language):
+        options = clt_interface.get_transliteration_options_for_language(
+            language, service=request.GET.get('service', None), search=request.GET.get('search', None))
+        return filtered_options_response(request, options)
+
+
+class CloudLanguageToolsLanguageDictionaryLookupOptions(APIView):
+    authentication_classes = APIView.authentication_classes + [TokenAuthentication]
+    permission_classes = (IsAuthenticated,)
+
+    def get_permissions(self):
+        if self.request.method == "GET":
+            return [AllowAny()]
+
+        return super().get_permissions()
+
+    @extend_schema(
+        parameters=FILTERED_OPTIONS_PARAMETERS,
+        tags=["cloudlanguagetools language data"],
+        operation_id="language_dictionary_lookup_options",
+        description=(
+            "Retrieve the dictionary lookup options for a language, optionally filtered by service and name prefix"
+        ),
+    )
+    @method_permission_classes([AllowAny])
+    def get(self, request, language):
+        options = clt_interface.get_dictionary_lookup_options_for_language(
+            language, service=request.GET.get('service', None), search=request.GET.get('search', None))
+        return filtered_options_response(request, options)
+
 
 class CloudLanguageToolsTranslationServices(APIView):
     authentication_classes = APIView.authentication_classes + [TokenAuthentication]
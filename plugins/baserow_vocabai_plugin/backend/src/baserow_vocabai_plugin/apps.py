@@ -18,3 +18,6 @@ class PluginNameConfig(AppConfig):
         field_type_registry.register(TransliterationFieldType())
         field_type_registry.register(DictionaryLookupFieldType())
         field_type_registry.register(ChineseRomanizationFieldType())
+
+        # noinspection PyUnresolvedReferences
+        import baserow_vocabai_plugin.cloudlanguagetools.signals  # noqa: F401
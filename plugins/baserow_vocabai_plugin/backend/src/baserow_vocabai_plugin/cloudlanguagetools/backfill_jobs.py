@@ -0,0 +1,311 @@
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from baserow.contrib.database.fields.models import Field
+
+from . import quotas
+from ..fields.vocabai_models import VocabAiBackfillJob, BACKFILL_STATUS_SCHEDULED, BACKFILL_STATUS_RUNNING, BACKFILL_STATUS_DEFERRED, BACKFILL_STATUS_FAILED
+
+logger = logging.getLogger(__name__)
+
+# a running job which hasn't checkpointed for this long has lost its worker (restart, deploy, time limit kill)
+BACKFILL_STALLED_TIMEOUT = 60 * 15
+# a deferred job is resumed once the quota covers its remaining rows, or at least this much of them (one full
+# batch of calls), so that it doesn't get resumed only to be deferred again after a few characters
+BACKFILL_RESUME_MIN_CHARACTERS = 1000
+# attempts in a row which can raise or stall without reaching a checkpoint, before the job is marked failed
+BACKFILL_MAX_FAILURES = 3
+
+
+def get_active_backfill_jobs(backfill_job):
+    # a job stops being active when it's superseded or cancelled (the row is deleted), or when the field gets trashed.
+    # the task stops working on it when the scheduler has handed it to another attempt
+    return VocabAiBackfillJob.objects.filter(id=backfill_job.id, attempt=backfill_job.attempt, status=BACKFILL_STATUS_RUNNING, field__trashed=False)
+
+def start_backfill_job(task, field_id, usage_user_id, backfill_job_id, backfill_attempt):
+    """returns the job for this run of the backfill task. a new backfill of the field supersedes the previous ones,
+    a continuation (backfill_job_id set) picks up the existing job. returns None if the job was superseded,
+    handed to another attempt, or the field trashed"""
+    if backfill_job_id != None:
+        return continue_backfill_job(field_id, backfill_job_id, backfill_attempt)
+
+    return create_backfill_job(field_id, task.name, list(task.request.args or []), task.request.kwargs or {}, usage_user_id)
+
+def lock_field(field_id):
+    """the field row is the lock which serializes backfills of the same field, across all workers.
+    returns None if the field was deleted"""
+    field = Field.objects_and_trash.select_for_update().filter(id=field_id).first()
+    if field == None or field.trashed:
+        logger.info(f'field {field_id} was deleted, not starting backfill')
+        return None
+    return field
+
+def create_backfill_job(field_id, task_name, task_args, task_kwargs, usage_user_id, status=BACKFILL_STATUS_RUNNING):
+    """a job which resumes with task_name(*task_args, **task_kwargs) when deferred or stalled"""
+    task_kwargs = dict(task_kwargs)
+    # continuations estimate the cost of the remaining rows themselves
+    task_kwargs.pop('estimated_characters', None)
+    task_kwargs.pop('backfill_job_id', None)
+    task_kwargs.pop('backfill_attempt', None)
+    with transaction.atomic():
+        if lock_field(field_id) == None:
+            return None
+
+        # older backfills of this field notice they were superseded at their next bucket
+        cancel_backfill_jobs(field_id)
+
+        return VocabAiBackfillJob.objects.create(
+            field_id=field_id,
+            status=status,
+            task_name=task_name,
+            task_args=task_args,
+            task_kwargs=task_kwargs,
+            usage_user_id=usage_user_id)
+
+def schedule_backfill_job(field_id, task_name, task_args, task_kwargs, usage_user_id):
+    """a job which waits for the dispatcher of its table, see tasks.schedule_backfill"""
+    return create_backfill_job(field_id, task_name, task_args, task_kwargs, usage_user_id, status=BACKFILL_STATUS_SCHEDULED)
+
+def create_deferred_backfill_job(field_id, task_name, task_args, usage_user_id, remaining_characters):
+    """a deferred job for work which ran out of quota outside of a backfill (the pending rows of a row update).
+    unlike create_backfill_job, it doesn't supersede the other jobs of the field"""
+    backfill_job = VocabAiBackfillJob.objects.create(
+        field_id=field_id,
+        status=BACKFILL_STATUS_DEFERRED,
+        task_name=task_name,
+        task_args=task_args,
+        usage_user_id=usage_user_id,
+        remaining_characters=remaining_characters)
+    logger.info(f'deferred {task_name} of field {field_id} for user {usage_user_id}, remaining characters: {remaining_characters}')
+    return backfill_job
+
+def create_pending_rows_job(field_id, task_name, task_args, usage_user_id):
+    """a running job for the rows which a row update left to a task, it records which rows are pending. like
+    create_deferred_backfill_job, it doesn't supersede the other jobs of the field"""
+    return VocabAiBackfillJob.objects.create(
+        field_id=field_id,
+        status=BACKFILL_STATUS_RUNNING,
+        task_name=task_name,
+        task_args=task_args,
+        usage_user_id=usage_user_id)
+
+def get_pending_row_ids(field_id, task_name):
+    """the rows of the field which the pending rows jobs (task_name) are going to compute. failed jobs won't"""
+    pending_row_ids = set()
+    job_queryset = VocabAiBackfillJob.objects.filter(field_id=field_id, task_name=task_name).exclude(status=BACKFILL_STATUS_FAILED)
+    for task_args in job_queryset.values_list('task_args', flat=True):
+        # the task arguments are [field_id, row_ids]
+        pending_row_ids.update(task_args[1])
+    return pending_row_ids
+
+def continue_backfill_job(field_id, backfill_job_id, backfill_attempt):
+    with transaction.atomic():
+        if lock_field(field_id) == None:
+            return None
+
+        backfill_job = VocabAiBackfillJob.objects.select_for_update().filter(id=backfill_job_id).first()
+        if backfill_job == None:
+            logger.info(f'backfill job {backfill_job_id} of field {field_id} was superseded')
+            return None
+        if backfill_job.attempt != backfill_attempt:
+            # the task sat in the queue long enough to be considered stalled, and was dispatched again
+            logger.info(f'backfill job {backfill_job_id} of field {field_id} was handed to attempt {backfill_job.attempt}, not running attempt {backfill_attempt}')
+            return None
+        backfill_job.status = BACKFILL_STATUS_RUNNING
+        backfill_job.save(update_fields=['status', 'updated_time'])
+        return backfill_job
+
+def continue_backfill_jobs(backfill_job_id_list, backfill_attempt_list):
+    """continue_backfill_job for each of the jobs, leaving out the ones which were superseded or handed to another attempt"""
+    backfill_attempts = dict(zip(backfill_job_id_list, backfill_attempt_list))
+    backfill_job_list = []
+    for backfill_job_id, field_id in VocabAiBackfillJob.objects.filter(id__in=backfill_job_id_list).values_list('id', 'field_id'):
+        backfill_job = continue_backfill_job(field_id, backfill_job_id, backfill_attempts[backfill_job_id])
+        if backfill_job != None:
+            backfill_job_list.append(backfill_job)
+    return backfill_job_list
+
+def cancel_backfill_jobs(field_id):
+    deleted_count, deleted_by_model = VocabAiBackfillJob.objects.filter(field_id=field_id).delete()
+    if deleted_count > 0:
+        logger.info(f'cancelled {deleted_count} backfill jobs of field {field_id}')
+
+def lock_active_backfill_job(backfill_job):
+    """call inside a transaction before writing results, returns False if the job isn't active anymore.
+    the lock ensures a superseded job can't write stale values after its replacement has started"""
+    return get_active_backfill_jobs(backfill_job).select_for_update(of=('self',)).exists()
+
+def checkpoint_backfill_job(backfill_job, last_row_id, stats, reserved_characters=None):
+    """rows up to last_row_id are populated, a later attempt continues from there. reserved_characters is the
+    quota the attempt still holds, if any.
+    returns False if the job isn't active anymore, the backfill should stop"""
+    backfill_job.last_row_id = last_row_id
+    backfill_job.rows = stats.rows
+    backfill_job.calls = stats.calls
+    backfill_job.calls_saved = stats.calls_saved
+    # making progress, the earlier failures don't count anymore
+    backfill_job.failures = 0
+    updates = {}
+    if reserved_characters != None:
+        backfill_job.reserved_characters = reserved_characters
+        updates['reserved_characters'] = reserved_characters
+    updated_count = get_active_backfill_jobs(backfill_job).update(
+        last_row_id=last_row_id,
+        rows=stats.rows,
+        calls=stats.calls,
+        calls_saved=stats.calls_saved,
+        failures=0,
+        updated_time=timezone.now(),
+        **updates)
+    return updated_count == 1
+
+def store_reserved_characters(backfill_job, reserved_characters):
+    """record the quota which the attempt holds, so that it can be given back if the attempt dies"""
+    backfill_job.reserved_characters = reserved_characters
+    VocabAiBackfillJob.objects.filter(id=backfill_job.id, attempt=backfill_job.attempt).update(reserved_characters=reserved_characters)
+
+def release_reserved_characters(backfill_job):
+    """give back the quota which a dead attempt held"""
+    if backfill_job.reserved_characters > 0:
+        logger.info(f'releasing {backfill_job.reserved_characters} characters reserved by attempt {backfill_job.attempt} of backfill job {backfill_job.id}')
+        quotas.get_usage_record(backfill_job.usage_user_id).release(backfill_job.reserved_characters)
+        backfill_job.reserved_characters = 0
+
+def create_shard_backfill_jobs(backfill_job, shard_row_ranges):
+    """replace the job with one job per (after row id, up to row id) range"""
+    shard_job_list = VocabAiBackfillJob.objects.bulk_create([
+        VocabAiBackfillJob(
+            field_id=backfill_job.field_id,
+            status=BACKFILL_STATUS_RUNNING,
+            task_name=backfill_job.task_name,
+            task_args=backfill_job.task_args,
+            task_kwargs=backfill_job.task_kwargs,
+            usage_user_id=backfill_job.usage_user_id,
+            last_row_id=after_row_id,
+            end_row_id=end_row_id) for after_row_id, end_row_id in shard_row_ranges
+    ])
+    backfill_job.delete()
+    return shard_job_list
+
+def lock_running_backfill_job_ids(backfill_job):
+    # the shards of a backfill share its task, the jobs of pending rows don't count
+    job_queryset = VocabAiBackfillJob.objects.select_for_update().filter(field_id=backfill_job.field_id, task_name=backfill_job.task_name, status=BACKFILL_STATUS_RUNNING)
+    return list(job_queryset.values_list('id', flat=True))
+
+def finish_backfill_job(backfill_job):
+    """returns True when no other job of the field is still running, so that the shards of a backfill can
+    notify the user once, at the end"""
+    with transaction.atomic():
+        running_job_id_list = lock_running_backfill_job_ids(backfill_job)
+        # unless it was handed to another attempt in the meantime, which finishes it instead
+        deleted_count, deleted_by_model = VocabAiBackfillJob.objects.filter(id=backfill_job.id, attempt=backfill_job.attempt).delete()
+    return deleted_count > 0 and set(running_job_id_list) <= {backfill_job.id}
+
+def defer_backfill_job(backfill_job, remaining_characters=None, task_args=None):
+    """the quota ran out, the scheduler resumes the job once the quota period rolls over.
+    remaining_characters is the estimated cost of the pending rows, if known. task_args replaces the arguments
+    the job resumes with, when they describe the pending work.
+    returns True when no other job of the field is still running"""
+    backfill_job.remaining_characters = remaining_characters
+    # the caller releases its reservation
+    updates = {'status': BACKFILL_STATUS_DEFERRED, 'remaining_characters': remaining_characters, 'reserved_characters': 0, 'updated_time': timezone.now()}
+    if task_args != None:
+        backfill_job.task_args = task_args
+        updates['task_args'] = task_args
+    with transaction.atomic():
+        running_job_id_list = lock_running_backfill_job_ids(backfill_job)
+        # unless it was superseded, cancelled or handed to another attempt in the meantime
+        updated_count = get_active_backfill_jobs(backfill_job).update(**updates)
+    if updated_count == 0:
+        return False
+    logger.info(f'deferred backfill of field {backfill_job.field_id} for user {backfill_job.usage_user_id}, after row id {backfill_job.last_row_id}, '
+                f'remaining characters: {remaining_characters}')
+    return set(running_job_id_list) <= {backfill_job.id}
+
+def count_failure(backfill_job, retry_status):
+    """the job goes to retry_status, or to failed once it has failed too many times in a row"""
+    backfill_job.failures += 1
+    backfill_job.status = retry_status
+    if backfill_job.failures >= BACKFILL_MAX_FAILURES:
+        logger.warning(f'backfill of field {backfill_job.field_id} failed {backfill_job.failures} times after row id {backfill_job.last_row_id}, giving up')
+        backfill_job.status = BACKFILL_STATUS_FAILED
+
+def fail_backfill_job(backfill_job, remaining_characters=None):
+    """the attempt raised. the scheduler retries the job along with the deferred ones, until it has failed
+    BACKFILL_MAX_FAILURES times without reaching a new checkpoint"""
+    with transaction.atomic():
+        locked_job = VocabAiBackfillJob.objects.select_for_update().filter(id=backfill_job.id, attempt=backfill_job.attempt).first()
+        if locked_job == None:
+            # superseded, cancelled or handed to another attempt
+            return
+        count_failure(locked_job, BACKFILL_STATUS_DEFERRED)
+        locked_job.remaining_characters = remaining_characters
+        # the caller releases its reservation
+        locked_job.reserved_characters = 0
+        locked_job.save(update_fields=['status', 'failures', 'remaining_characters', 'reserved_characters', 'updated_time'])
+
+def get_resume_threshold(backfill_job):
+    """the quota which needs to be available before resuming the job"""
+    if backfill_job.remaining_characters == None or backfill_job.remaining_characters <= 0:
+        # unknown, or the estimate was exceeded
+        return BACKFILL_RESUME_MIN_CHARACTERS
+    return min(backfill_job.remaining_characters, BACKFILL_RESUME_MIN_CHARACTERS)
+
+def take_resumable_backfill_jobs():
+    """deferred jobs whose user has enough quota available again, they are marked as running.
+    only the oldest one is resumed for each user, so that the remaining allowance isn't split between
+    several backfills"""
+    resumable_job_list = []
+    with transaction.atomic():
+        job_queryset = VocabAiBackfillJob.objects.select_for_update(skip_locked=True, of=('self',)).select_related('field')
+        usage_user_id_set = set()
+        for backfill_job in job_queryset.filter(status=BACKFILL_STATUS_DEFERRED).order_by('updated_time'):
+            if backfill_job.usage_user_id in usage_user_id_set:
+                continue
+            usage_user_id_set.add(backfill_job.usage_user_id)
+            if backfill_job.field.trashed:
+                continue
+            available_characters = quotas.get_usage_record(backfill_job.usage_user_id).get_available_characters()
+            if available_characters < get_resume_threshold(backfill_job):
+                continue
+            resumable_job_list.append(backfill_job)
+        take_backfill_jobs(resumable_job_list, status=BACKFILL_STATUS_RUNNING)
+    return resumable_job_list
+
+def take_scheduled_backfill_jobs(table_id):
+    """the scheduled jobs of the table, they are marked as running. the jobs scheduled after this call wait
+    for the next dispatch"""
+    with transaction.atomic():
+        job_queryset = VocabAiBackfillJob.objects.select_for_update(skip_locked=True, of=('self',)).select_related('field')
+        scheduled_job_list = list(job_queryset.filter(status=BACKFILL_STATUS_SCHEDULED, field__table_id=table_id, field__trashed=False).order_by('id'))
+        take_backfill_jobs(scheduled_job_list, status=BACKFILL_STATUS_RUNNING)
+    return scheduled_job_list
+
+def take_stalled_backfill_jobs():
+    """running jobs which stopped checkpointing, they get restarted from their last checkpoint. the quota held by
+    the dead attempt is given back, and a job which keeps stalling is marked failed. scheduled jobs whose dispatch
+    was lost are started the same way"""
+    stalled_cutoff = timezone.now() - datetime.timedelta(seconds=BACKFILL_STALLED_TIMEOUT)
+    stalled_job_list = []
+    with transaction.atomic():
+        job_queryset = VocabAiBackfillJob.objects.select_for_update(skip_locked=True)
+        for backfill_job in job_queryset.filter(status__in=[BACKFILL_STATUS_SCHEDULED, BACKFILL_STATUS_RUNNING], updated_time__lt=stalled_cutoff, field__trashed=False):
+            release_reserved_characters(backfill_job)
+            count_failure(backfill_job, BACKFILL_STATUS_RUNNING)
+            if backfill_job.status == BACKFILL_STATUS_RUNNING:
+                # the tasks of the previous attempt stop when they next touch the job
+                backfill_job.attempt += 1
+                stalled_job_list.append(backfill_job)
+            backfill_job.save(update_fields=['status', 'attempt', 'failures', 'reserved_characters', 'updated_time'])
+    return stalled_job_list
+
+def take_backfill_jobs(backfill_job_list, **updates):
+    """start a new attempt of the jobs, the tasks of the previous attempts stop when they next touch the job"""
+    VocabAiBackfillJob.objects.filter(id__in=[backfill_job.id for backfill_job in backfill_job_list]).update(
+        attempt=F('attempt') + 1, updated_time=timezone.now(), **updates)
+    for backfill_job in backfill_job_list:
+        backfill_job.attempt += 1
@@ -1,16 +1,36 @@
 import logging
 import redis
 import json
+import os
 import datetime
+import concurrent.futures
 import cloudlanguagetools.servicemanager
 
 from .quotas import get_usage_record
+from . import translation_memory
+from . import dictionary_memory
+from . import singleflight
 from ..fields.vocabai_models import VocabAiLanguageData
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 
 logger = logging.getLogger(__name__)
 
+LANGUAGE_DATA_VERSION_CACHE_KEY = 'vocabai_language_data_version'
+# process-local copy of the language data record, reloaded when the version changes
+language_data_cache = {'version': None, 'record': None, 'index': None}
+
+# number of requests kept in flight for a service when processing many values,
+# VOCABAI_CLT_SERVICE_CONCURRENCY can override it per service, ie {"Azure": 8, "DeepL": 2}
+CLT_DEFAULT_CONCURRENCY = int(os.environ.get('VOCABAI_CLT_CONCURRENCY', 4))
+CLT_SERVICE_CONCURRENCY = json.loads(os.environ.get('VOCABAI_CLT_SERVICE_CONCURRENCY', '{}'))
+
+# texts are sent in batches, the quota is charged once per batch
+CLT_BATCH_MAX_SIZE = 50
+CLT_BATCH_MAX_CHARACTERS = 1000
+
 manager = cloudlanguagetools.servicemanager.ServiceManager() 
 manager.configure_default()
 
@@ -43,13 +63,89 @@ def update_language_data():
     # update database
     language_data_record.save()
 
+    # let all the web and celery processes know they need to reload
+    set_language_data_version(language_data_record.updated_time)
+
     logger.info('saved language data')
-        
-def get_language_data_record():
+
+def set_language_data_version(updated_time):
+    version = updated_time.isoformat()
+    cache.set(LANGUAGE_DATA_VERSION_CACHE_KEY, version, timeout=None)
+    return version
+
+def get_language_data_version():
+    # the version lives in the shared cache, so that an update in one process is seen by all the others
+    version = cache.get(LANGUAGE_DATA_VERSION_CACHE_KEY)
+    if version == None:
+        updated_time = VocabAiLanguageData.objects.values_list('updated_time', flat=True).first()
+        if updated_time == None:
+            raise Exception(f'could not find language data record')
+        version = set_language_data_version(updated_time)
+    return version
+
+class LanguageDataIndex():
+    """lookup tables over the premium transformation options, built once per language data version"""
+
+    def __init__(self, language_data_record):
+        options = language_data_record.premium_transformation_options
+
+        # (language_code, service) -> service-specific language_id
+        self.translation_language_ids = {}
+        services_by_language = {}
+        for option in options['translation_options']:
+            self.translation_language_ids[(option['language_code'], option['service'])] = option['language_id']
+            services_by_language.setdefault(option['language_code'], set()).add(option['service'])
+
+        # (source language_code, target language_code) -> services able to translate between them
+        self.translation_services = {}
+        for source_language, source_services in services_by_language.items():
+            for target_language, target_services in services_by_language.items():
+                common_services = source_services.intersection(target_services)
+                if len(common_services) > 0:
+                    self.translation_services[(source_language, target_language)] = sorted(common_services)
+
+        # transliteration_id / lookup_id -> option
+        self.transliteration_options = {x['transliteration_id']: x for x in options['transliteration_options']}
+        self.dictionary_lookup_options = {x['lookup_id']: x for x in options['dictionary_lookup_options']}
+
+        # language_code -> options, for the field creation forms
+        self.transliteration_options_by_language = {}
+        for option in options['transliteration_options']:
+            self.transliteration_options_by_language.setdefault(option['language_code'], []).append(option)
+        self.dictionary_lookup_options_by_language = {}
+        for option in options['dictionary_lookup_options']:
+            self.dictionary_lookup_options_by_language.setdefault(option['language_code'], []).append(option)
+
+def load_language_data():
+    global language_data_cache
+    version = get_language_data_version()
+    cached_entry = language_data_cache
+    if cached_entry['version'] == version:
+        return cached_entry
+
+    logger.info(f'loading language data, version {version}')
     language_data_records = VocabAiLanguageData.objects.all()
     if len(language_data_records) != 1:
         raise Exception(f'could not find language data record')
-    return language_data_records[0]
+    language_data_record = language_data_records[0]
+    cached_entry = {
+        'version': language_data_record.updated_time.isoformat(),
+        'record': language_data_record,
+        'index': LanguageDataIndex(language_data_record)
+    }
+    language_data_cache = cached_entry
+    if cached_entry['version'] != version and cache.get(LANGUAGE_DATA_VERSION_CACHE_KEY) == version:
+        # the shared version doesn't match the record (a stale value was written), fix it, otherwise every
+        # process would reload on every call
+        logger.warning(f'language data version {version} does not match the record, setting it to {cached_entry["version"]}')
+        set_language_data_version(language_data_record.updated_time)
+    return cached_entry
+
+def get_language_data_record():
+    return load_language_data()['record']
+
+def get_language_data_index():
+    return load_language_data()['index']
 
 def get_language_list():
     return get_language_data_record().language_list
@@ -63,80 +159,245 @@ def get_transliteration_options():
 def get_dictionary_lookup_options():
     return get_language_data_record().premium_transformation_options['dictionary_lookup_options']
 
-def get_translation_services_source_target_language(source_language, target_language):
-    translation_options = get_translation_options()
-    source_language_options = [x for x in translation_options if x['language_code'] == source_language]
-    target_language_options = [x for x in translation_options if x['language_code'] == target_language]
-    source_services = [x['service'] for x in source_language_options]
-    target_services = [x['service'] for x in target_language_options]
-    service_list = list(set(source_services).intersection(target_services))
-    return service_list
+def filter_options(options, service, search, name_key):
+    """keep options for the given service, whose name has a word starting with search (case insensitive)"""
+    if service:
+        options = [x for x in options if x['service'] == service]
+    if search:
+        search = search.lower()
+        options = [x for x in options if any(word.startswith(search) for word in [x[name_key].lower()] + x[name_key].lower().split())]
+    return options
 
+def get_transliteration_options_for_language(language, service=None, search=None):
+    options = get_language_data_index().transliteration_options_by_language.get(language, [])
+    return filter_options(options, service, search, 'transliteration_shortname')
 
-def get_translation(text, source_language, target_language, service, usage_user_id):
-    translation_options = get_translation_options()
-    source_language_options = [x for x in translation_options if x['language_code'] == source_language and x['service'] == service]
-    target_language_options = [x for x in translation_options if x['language_code'] == target_language and x['service'] == service]
-    source_language_key = source_language_options[0]['language_id']
-    target_language_key = target_language_options[0]['language_id']
+def get_dictionary_lookup_options_for_language(language, service=None, search=None):
+    options = get_language_data_index().dictionary_lookup_options_by_language.get(language, [])
+    return filter_options(options, service, search, 'lookup_shortname')
 
-    usage_record = get_usage_record(usage_user_id)
-    character_cost = manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.translation)    
-    logger.debug(f'character_cost: {character_cost}, service: {service}')
-    usage_record.check_quota_available(character_cost)
+def get_translation_services_source_target_language(source_language, target_language):
+    return get_language_data_index().translation_services.get((source_language, target_language), [])
+
+
+def get_service_concurrency(service):
+    return CLT_SERVICE_CONCURRENCY.get(service, CLT_DEFAULT_CONCURRENCY)
+
+def iterate_results_concurrently(fn, values, concurrency):
+    """call fn on each value, with up to concurrency calls in flight, and yield (value, result) in input order.
+    if any call fails, the remaining calls are cancelled, the results which did complete are still yielded,
+    and the first exception is raised at the end.
+    fn runs on worker threads, so it must not touch the database."""
+
+    # threads don't see uncommitted data, so stay sequential inside a transaction
+    if concurrency <= 1 or len(values) <= 1 or connection.in_atomic_block:
+        for value in values:
+            yield value, fn(value)
+        return
+
+    first_exception = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        future_list = [executor.submit(fn, value) for value in values]
+        for value, future in zip(values, future_list):
+            try:
+                result = future.result()
+            except concurrent.futures.CancelledError:
+                continue
+            except Exception as e:
+                if first_exception == None:
+                    first_exception = e
+                    for pending_future in future_list:
+                        pending_future.cancel()
+                continue
+            yield value, result
+    if first_exception != None:
+        raise first_exception
+
+def iterate_batches(texts):
+    """split texts into batches, bounded in number of texts and number of characters"""
+    batch = []
+    batch_characters = 0
+    for text in texts:
+        if len(batch) > 0 and (len(batch) >= CLT_BATCH_MAX_SIZE or batch_characters + len(text) > CLT_BATCH_MAX_CHARACTERS):
+            yield batch
+            batch = []
+            batch_characters = 0
+        batch.append(text)
+        batch_characters += len(text)
+    if len(batch) > 0:
+        yield batch
+
+def charge_quota(usage_user_id, character_cost, quota_reservation=None):
+    if character_cost <= 0:
+        return
+    if quota_reservation != None:
+        quota_reservation.charge(character_cost)
+    else:
+        get_usage_record(usage_user_id).reserve(character_cost)
 
-    translated_text = manager.get_translation(text, service, source_language_key, target_language_key)
+def refund_quota(usage_user_id, character_cost, quota_reservation=None):
+    if character_cost <= 0:
+        return
+    if quota_reservation != None:
+        quota_reservation.refund(character_cost)
+    else:
+        get_usage_record(usage_user_id).release(character_cost)
+
+def run_batch(texts, service, request_type, call_fn, usage_user_id, results, quota_reservation=None, item_text=None, call_key=None):
+    """charge the quota for the whole batch at once, then run call_fn on each distinct text, with bounded concurrency.
+    results is filled with text -> result. calls which didn't complete, or returned None (not found), are refunded.
+    texts can also be tuples, item_text then returns the text of each one, the one the service charges for.
+    call_key returns the singleflight key of each text: calls which another worker is already making aren't made
+    (or charged) again, we get the result that worker publishes"""
+    distinct_texts = list(dict.fromkeys(texts))
+    if item_text == None:
+        item_text = lambda text: text
+
+    waiting_texts = []
+    if call_key != None:
+        distinct_texts, waiting_texts = singleflight.lead(distinct_texts, call_key)
+    try:
+        run_calls(distinct_texts, service, request_type, call_fn, usage_user_id, results, quota_reservation, item_text)
+    finally:
+        if call_key != None:
+            singleflight.publish(distinct_texts, call_key, results)
+
+    if len(waiting_texts) > 0:
+        # the calls which didn't publish a result in time are made here after all
+        run_calls(singleflight.wait(waiting_texts, call_key, results), service, request_type, call_fn, usage_user_id, results, quota_reservation, item_text)
+
+def run_calls(distinct_texts, service, request_type, call_fn, usage_user_id, results, quota_reservation, item_text):
+    if len(distinct_texts) == 0:
+        return
+    character_costs = {text: manager.service_cost(item_text(text), service, request_type) for text in distinct_texts}
+    logger.debug(f'character_cost: {sum(character_costs.values())}, service: {service}, texts: {len(distinct_texts)}')
+    charge_quota(usage_user_id, sum(character_costs.values()), quota_reservation)
 
+    try:
+        for text, result in iterate_results_concurrently(call_fn, distinct_texts, get_service_concurrency(service)):
+            results[text] = result
+    finally:
+        refund_quota(usage_user_id, sum(cost for text, cost in character_costs.items() if results.get(text, None) == None), quota_reservation)
+
+
+def get_translation_language_keys(source_language, target_language, service):
+    translation_language_ids = get_language_data_index().translation_language_ids
+    source_language_key = translation_language_ids[(source_language, service)]
+    target_language_key = translation_language_ids[(target_language, service)]
+    return source_language_key, target_language_key
+
+def get_translation_cost(text, service):
+    return manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.translation)
+
+def get_translation_batch(texts, source_language, target_language, service, usage_user_id, quota_reservation=None):
+    """translate a list of texts, the results are returned in input order"""
+    return get_translation_batch_multi_target(texts, source_language, [target_language], service, usage_user_id, quota_reservation)[target_language]
+
+def get_translation_batch_multi_target(texts, source_language, target_languages, service, usage_user_id, quota_reservation=None):
+    """translate a list of texts into several languages, returns target language -> results in input order.
+    the calls for all the target languages go through the same batches, so that they share one quota charge and
+    run concurrently"""
+    language_keys = {}
+    results = {}
+    for target_language in target_languages:
+        language_keys[target_language] = get_translation_language_keys(source_language, target_language, service)
+        # translation memory hits are free
+        results[target_language] = translation_memory.lookup_translations(texts, service, *language_keys[target_language])
+    missing_texts = [text for text in texts if any(text not in results[target_language] for target_language in target_languages)]
+
+    def translate(item):
+        text, target_language = item
+        source_language_key, target_language_key = language_keys[target_language]
+        return manager.get_translation(text, service, source_language_key, target_language_key)
+
+    for batch in iterate_batches(list(dict.fromkeys(missing_texts))):
+        batch_items = [(text, target_language) for text in batch for target_language in target_languages if text not in results[target_language]]
+        translated_items = {}
+        try:
+            run_batch(batch_items, service, cloudlanguagetools.constants.RequestType.translation, translate, usage_user_id, translated_items, quota_reservation,
+                      item_text=lambda item: item[0],
+                      call_key=lambda item: singleflight.get_call_key('translation', service, language_keys[item[1]], item[0]))
+        finally:
+            for target_language in target_languages:
+                translated_texts = {text: result for (text, item_target_language), result in translated_items.items() if item_target_language == target_language}
+                translation_memory.store_translations(translated_texts, service, *language_keys[target_language])
+        for (text, target_language), result in translated_items.items():
+            results[target_language][text] = result
+
+    return {target_language: [results[target_language][text] for text in texts] for target_language in target_languages}
 
-    usage_record.update_usage(character_cost)
+def get_translation(text, source_language, target_language, service, usage_user_id):
+    return get_translation_batch([text], source_language, target_language, service, usage_user_id)[0]
 
-    return translated_text
 
+def get_transliteration_cost(text, transliteration_id):
+    service = get_language_data_index().transliteration_options[transliteration_id]['service']
+    return manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.transliteration)
 
-def get_transliteration(text, transliteration_id, usage_user_id):
-    transliteration_options = get_transliteration_options()
-    transliteration_option = [x for x in transliteration_options if x['transliteration_id'] == transliteration_id]
-    service = transliteration_option[0]['service']
-    transliteration_key = transliteration_option[0]['transliteration_key']
+def get_transliteration_batch(texts, transliteration_id, usage_user_id, quota_reservation=None):
+    """transliterate a list of texts, the results are returned in input order"""
+    transliteration_option = get_language_data_index().transliteration_options[transliteration_id]
+    service = transliteration_option['service']
+    transliteration_key = transliteration_option['transliteration_key']
 
-    usage_record = get_usage_record(usage_user_id)
-    character_cost = manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.transliteration)
-    usage_record.check_quota_available(character_cost)
+    def transliterate(text):
+        return manager.get_transliteration(text, service, transliteration_key)
 
-    translated_text = manager.get_transliteration(text, service, transliteration_key)
+    results = {}
+    for batch in iterate_batches(list(dict.fromkeys(texts))):
+        run_batch(batch, service, cloudlanguagetools.constants.RequestType.transliteration, transliterate, usage_user_id, results, quota_reservation,
+                  call_key=lambda text: singleflight.get_call_key('transliteration', service, transliteration_key, text))
 
+    return [results[text] for text in texts]
 
-    usage_record.update_usage(character_cost)
+def get_transliteration(text, transliteration_id, usage_user_id):
+    return get_transliteration_batch([text], transliteration_id, usage_user_id)[0]
 
-    return translated_text    
 
+def flatten_dictionary_lookup_result(lookup_result):
+    if isinstance(lookup_result, list):
+        return ' / '.join(lookup_result)
+    elif isinstance(lookup_result, dict):
+        result_list = []
+        for key, value in lookup_result.items():
+            result_list.append(key + ': ' + ' / '.join(value))
+        return ', '.join(result_list)
+    else:
+        return str(lookup_result)
+
+def get_dictionary_lookup_cost(text, lookup_id):
+    service = get_language_data_index().dictionary_lookup_options[lookup_id]['service']
+    return manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.dictionary)
+
+def get_dictionary_lookup_batch(texts, lookup_id, usage_user_id, quota_reservation=None):
+    """lookup a list of texts, the results are returned in input order, None when not found"""
+    lookup_option = get_language_data_index().dictionary_lookup_options[lookup_id]
+    service = lookup_option['service']
+    lookup_key = lookup_option['lookup_key']
+
+    def lookup(text):
+        try:
+            return flatten_dictionary_lookup_result(manager.get_dictionary_lookup(text, service, lookup_key))
+        except cloudlanguagetools.errors.NotFoundError:
+            # not found isn't charged
+            return None
+
+    # dictionary memory hits are free, including the words which weren't found
+    results = dictionary_memory.lookup_results(texts, service, lookup_key)
+    missing_texts = [text for text in texts if text not in results]
+    for batch in iterate_batches(list(dict.fromkeys(missing_texts))):
+        lookup_results = {}
+        try:
+            run_batch(batch, service, cloudlanguagetools.constants.RequestType.dictionary, lookup, usage_user_id, lookup_results, quota_reservation,
+                      call_key=lambda text: singleflight.get_call_key('dictionary', service, lookup_key, text))
+        finally:
+            dictionary_memory.store_results(lookup_results, service, lookup_key)
+        results.update(lookup_results)
+
+    return [results[text] for text in texts]
 
 def get_dictionary_lookup(text, lookup_id, usage_user_id):
-    dictionary_lookup_options = get_dictionary_lookup_options()
-    lookup_option = [x for x in dictionary_lookup_options if x['lookup_id'] == lookup_id]
-    service = lookup_option[0]['service']
-    lookup_key = lookup_option[0]['lookup_key']
-
-    usage_record = get_usage_record(usage_user_id)
-    character_cost = manager.service_cost(text, service, cloudlanguagetools.constants.RequestType.dictionary)
-    usage_record.check_quota_available(character_cost)
-
-    try:
-        lookup_result = manager.get_dictionary_lookup(text, service, lookup_key)
-
-        usage_record.update_usage(character_cost)        
-
-        if isinstance(lookup_result, list):
-            return ' / '.join(lookup_result)
-        elif isinstance(lookup_result, dict):
-            result_list = []
-            for key, value in lookup_result.items():
-                result_list.append(key + ': ' + ' / '.join(value))
-            return ', '.join(result_list)
-        else:
-            return str(lookup_result)
-    except cloudlanguagetools.errors.NotFoundError:
-        return None
+    return get_dictionary_lookup_batch([text], lookup_id, usage_user_id)[0]
 
 
 def get_pinyin(text, tone_numbers, spaces, corrections=[]):
@@ -0,0 +1,87 @@
+import datetime
+import logging
+import os
+
+from django.utils import timezone
+
+from .translation_memory import get_text_hash, is_cacheable
+from ..fields.vocabai_models import VocabAiDictionaryMemory
+
+logger = logging.getLogger(__name__)
+
+# entries older than this are not served anymore, and get deleted by the eviction task
+DICTIONARY_MEMORY_TTL_DAYS = int(os.environ.get('VOCABAI_DICTIONARY_MEMORY_TTL_DAYS', 90))
+# words which weren't found are remembered for a shorter time, dictionaries get new entries
+DICTIONARY_MEMORY_NOT_FOUND_TTL_DAYS = int(os.environ.get('VOCABAI_DICTIONARY_MEMORY_NOT_FOUND_TTL_DAYS', 7))
+# maximum number of entries kept, the oldest ones get evicted first
+DICTIONARY_MEMORY_MAX_ENTRIES = int(os.environ.get('VOCABAI_DICTIONARY_MEMORY_MAX_ENTRIES', 1000000))
+
+
+def get_expiry_cutoff():
+    return timezone.now() - datetime.timedelta(days=DICTIONARY_MEMORY_TTL_DAYS)
+
+def get_not_found_expiry_cutoff():
+    return timezone.now() - datetime.timedelta(days=DICTIONARY_MEMORY_NOT_FOUND_TTL_DAYS)
+
+
+def lookup_results(texts, service, lookup_key):
+    """returns a dict text -> memorized lookup result, for the texts we have a result for.
+    the result is None when the text isn't in the dictionary"""
+    texts_by_hash = {}
+    for text in texts:
+        if is_cacheable(text):
+            texts_by_hash.setdefault(get_text_hash(text), []).append(text)
+    if len(texts_by_hash) == 0:
+        return {}
+
+    entries = VocabAiDictionaryMemory.objects.filter(
+        text_hash__in=list(texts_by_hash.keys()),
+        service=service,
+        lookup_key=lookup_key,
+        created_time__gte=get_expiry_cutoff()
+    ).values_list('text_hash', 'result', 'created_time')
+
+    not_found_cutoff = get_not_found_expiry_cutoff()
+    results = {}
+    for text_hash, result, created_time in entries:
+        if result == None and created_time < not_found_cutoff:
+            continue
+        for text in texts_by_hash[text_hash]:
+            results[text] = result
+    return results
+
+
+def store_results(results, service, lookup_key):
+    """results is a dict text -> lookup result, None for texts which weren't found"""
+    entries = {}
+    for text, result in results.items():
+        if is_cacheable(text):
+            entries[get_text_hash(text)] = result
+    if len(entries) == 0:
+        return
+
+    key = {
+        'service': service,
+        'lookup_key': lookup_key
+    }
+    # replace expired entries which haven't been evicted yet
+    VocabAiDictionaryMemory.objects.filter(text_hash__in=list(entries.keys()), **key).delete()
+    now = timezone.now()
+    VocabAiDictionaryMemory.objects.bulk_create([
+        VocabAiDictionaryMemory(text_hash=text_hash, result=result, created_time=now, **key)
+        for text_hash, result in entries.items()
+    ], ignore_conflicts=True)
+
+
+def evict_dictionary_memory():
+    # remove expired entries
+    expired_count, _ = VocabAiDictionaryMemory.objects.filter(created_time__lt=get_expiry_cutoff()).delete()
+    not_found_count, _ = VocabAiDictionaryMemory.objects.filter(result=None, created_time__lt=get_not_found_expiry_cutoff()).delete()
+
+    # enforce size limit, oldest entries go first
+    evicted_count = 0
+    oldest_kept = VocabAiDictionaryMemory.objects.order_by('-created_time').values_list('created_time', flat=True)[DICTIONARY_MEMORY_MAX_ENTRIES:DICTIONARY_MEMORY_MAX_ENTRIES + 1]
+    if len(oldest_kept) == 1:
+        evicted_count, _ = VocabAiDictionaryMemory.objects.filter(created_time__lte=oldest_kept[0]).delete()
+
+    logger.info(f'dictionary memory eviction: {expired_count} expired, {not_found_count} not found expired, {evicted_count} over size limit')
@@ -0,0 +1,49 @@
+import hashlib
+import json
+import logging
+
+from ..fields.vocabai_models import VocabAiCellFingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def get_hash(value):
+    # 64 bits are plenty to tell whether a single cell changed, and keep the side table compact
+    return int.from_bytes(hashlib.sha256(value.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+def get_source_hash(text):
+    return get_hash(text)
+
+def get_config_hash(*config_values):
+    return get_hash(json.dumps(config_values))
+
+
+def get_unchanged_row_ids(field_id, source_hashes, config_hash):
+    """source_hashes is a dict row_id -> source_hash, returns the set of row ids which were last computed
+    from the same source value and settings"""
+    if len(source_hashes) == 0:
+        return set()
+    fingerprint_queryset = VocabAiCellFingerprint.objects.filter(field_id=field_id, row_id__in=list(source_hashes.keys()), config_hash=config_hash)
+    return set(row_id for row_id, source_hash in fingerprint_queryset.values_list('row_id', 'source_hash') if source_hashes[row_id] == source_hash)
+
+def store_fingerprints(field_id, source_hashes, config_hash):
+    """record the fingerprints of cells which were just computed"""
+    if len(source_hashes) == 0:
+        return
+    VocabAiCellFingerprint.objects.filter(field_id=field_id, row_id__in=list(source_hashes.keys())).delete()
+    VocabAiCellFingerprint.objects.bulk_create([
+        VocabAiCellFingerprint(field_id=field_id, row_id=row_id, source_hash=source_hash, config_hash=config_hash)
+        for row_id, source_hash in source_hashes.items()
+    ], ignore_conflicts=True)
+
+def clear_fingerprints(field_id, row_ids):
+    """the cells were emptied, they need to be computed next time"""
+    if len(row_ids) == 0:
+        return
+    VocabAiCellFingerprint.objects.filter(field_id=field_id, row_id__in=row_ids).delete()
+
+def clear_row_fingerprints(table_id, row_ids):
+    """the rows were deleted, drop the fingerprints of all their cells"""
+    if len(row_ids) == 0:
+        return
+    VocabAiCellFingerprint.objects.filter(field__table_id=table_id, row_id__in=row_ids).delete()
@@ -3,14 +3,25 @@ import logging
 
 from ..fields.vocabai_models import VocabAiUsage, USAGE_PERIOD_MONTHLY, USAGE_PERIOD_DAILY
 
+from baserow.core.models import WORKSPACE_USER_PERMISSION_ADMIN, WorkspaceUser
+
 from django.contrib.auth import get_user_model
-User = get_user_model()
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+User = get_user_model()
+
 FREE_ACCOUNT_DAILY_MAX_CHARACTERS=5000
 FREE_ACCOUNT_MONTHLY_MAX_CHARACTERS=25000
 
+# the usage user of a workspace is invalidated by the workspace user signals, the timeout covers changes
+# which bypass them (django admin, shell)
+USAGE_USER_CACHE_TIMEOUT = 3600
+
 
 from rest_framework.exceptions import APIException
 
@@ -33,43 +44,155 @@ class UsageRecord():
             if self.daily_usage_record.characters + characters > FREE_ACCOUNT_DAILY_MAX_CHARACTERS:
                 raise QuotaOverUsage('Daily', self.daily_usage_record.characters, FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
 
+    def get_available_characters(self):
+        """how many characters can still be used, in both the current day and month"""
+        return max(0, min(FREE_ACCOUNT_MONTHLY_MAX_CHARACTERS - self.monthly_usage_record.characters,
+                          FREE_ACCOUNT_DAILY_MAX_CHARACTERS - self.daily_usage_record.characters))
+
+    def reserve(self, characters):
+        """check the quota and charge it in a single atomic statement, so that concurrent workers can't
+        overspend. raises QuotaOverUsage, without charging anything, when there isn't enough left."""
+        if characters <= 0:
+            return
+        monthly = self.monthly_usage_record
+        daily = self.daily_usage_record
+        with transaction.atomic():
+            updated_count = VocabAiUsage.objects.filter(
+                Q(id=monthly.id, characters__lte=FREE_ACCOUNT_MONTHLY_MAX_CHARACTERS - characters) |
+                Q(id=daily.id, characters__lte=FREE_ACCOUNT_DAILY_MAX_CHARACTERS - characters)
+            ).update(characters=F('characters') + characters, updated_time=timezone.now())
+            if updated_count != 2:
+                # roll back, and report which period is exhausted
+                transaction.set_rollback(True)
+        if updated_count != 2:
+            monthly.refresh_from_db(fields=['characters'])
+            daily.refresh_from_db(fields=['characters'])
+            self.check_quota_available(characters)
+            # the quota was used up concurrently
+            raise QuotaOverUsage('Daily', daily.characters, FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
+
+        monthly.characters = monthly.characters + characters
+        daily.characters = daily.characters + characters
+        self.log_usage()
+
+    def release(self, characters):
+        """give back characters which were reserved but not used"""
+        if characters > 0:
+            self.update_usage(-characters)
+
     def update_usage(self, character_cost):
-        if character_cost > 0:
+        # character_cost is negative when refunding
+        if character_cost != 0:
+            # increment in the database, so that concurrent updates don't get lost
+            VocabAiUsage.objects.filter(id__in=[self.daily_usage_record.id, self.monthly_usage_record.id]).update(
+                characters=F('characters') + character_cost,
+                updated_time=timezone.now())
+
             self.daily_usage_record.characters = self.daily_usage_record.characters + character_cost
             self.monthly_usage_record.characters = self.monthly_usage_record.characters + character_cost
 
-            self.daily_usage_record.save()
-            self.monthly_usage_record.save()
-
             self.log_usage()
 
     def log_usage(self):
-        user = self.daily_usage_record.user
+        user = self.daily_usage_record.user_id
         daily = self.daily_usage_record
         monthly = self.monthly_usage_record
         logger.debug(f'usage for {user}, daily/{daily.period_time}: {daily.characters} characters, monthly/{monthly.period_time}: {monthly.characters} characters')
 
-def get_usage_record(usage_user_id):
-    # locate user
-    user_records = User.objects.filter(id=usage_user_id)
-    if len(user_records) != 1:
-        logger.error(f'found {len(user_records)} records for user_id: {usage_user_id}')
-    user = user_records[0]
+class QuotaReservation():
+    """characters reserved up front for a long running job (a full table backfill), which the job then
+    charges against locally, without going back to the database for every batch. the unused part is given
+    back by release()"""
+    def __init__(self, usage_record, reserved_characters, requested_characters=None):
+        self.usage_record = usage_record
+        self.reserved_characters = reserved_characters
+        # the estimate, which can be more than what the quota allowed to reserve
+        self.requested_characters = requested_characters if requested_characters != None else reserved_characters
+        self.used_characters = 0
+
+    def charge(self, characters):
+        if characters <= 0:
+            return
+        shortfall = self.used_characters + characters - self.reserved_characters
+        if shortfall > 0:
+            # the estimate was exceeded (rows added while the job runs), try to extend the reservation,
+            # raises QuotaOverUsage if the quota doesn't allow it
+            self.usage_record.reserve(shortfall)
+            self.reserved_characters += shortfall
+        self.used_characters += characters
+
+    def refund(self, characters):
+        if characters > 0:
+            self.used_characters -= characters
+
+    def release(self):
+        self.usage_record.release(self.reserved_characters - self.used_characters)
+        self.reserved_characters = self.used_characters
+
+    def get_unused_characters(self):
+        """reserved, but not used yet"""
+        return max(0, self.reserved_characters - self.used_characters)
+
+    def get_remaining_characters(self):
+        """how much of the estimate wasn't used"""
+        return max(0, self.requested_characters - self.used_characters)
+
+    def __str__(self):
+        return f'reserved: {self.reserved_characters} characters, used: {self.used_characters} characters'
+
+def reserve_quota(usage_user_id, characters):
+    """reserve characters in one step, or as much of it as the quota currently allows"""
+    usage_record = get_usage_record(usage_user_id)
+    reserved_characters = min(characters, usage_record.get_available_characters())
+    try:
+        usage_record.reserve(reserved_characters)
+    except QuotaOverUsage:
+        # used up concurrently, start with an empty reservation
+        reserved_characters = 0
+    return QuotaReservation(usage_record, reserved_characters, characters)
 
+def get_usage_record(usage_user_id):
     period_time_monthly = int(datetime.datetime.today().strftime('%Y%m'))
     period_time_daily = int(datetime.datetime.today().strftime('%Y%m%d'))        
 
-    return UsageRecord(get_usage_entry(user, USAGE_PERIOD_MONTHLY, period_time_monthly), 
-                       get_usage_entry(user, USAGE_PERIOD_DAILY, period_time_daily))
-
-
-def get_usage_entry(user, period, period_time):
-    monthly_usage_records = VocabAiUsage.objects.filter(user=user, period=period, period_time=period_time)
-    if len(monthly_usage_records) == 0:
-        # create record
-        usage = VocabAiUsage(user=user, period=period, period_time=period_time, characters=0)
-        usage.save()
-    else:
-        usage = monthly_usage_records[0]
-
-    return usage
\ No newline at end of file
+    # retrieve both entries in one query, they only need to be created once per period
+    usage_entries = {}
+    for usage in VocabAiUsage.objects.filter(
+            Q(period=USAGE_PERIOD_MONTHLY, period_time=period_time_monthly) | Q(period=USAGE_PERIOD_DAILY, period_time=period_time_daily),
+            user_id=usage_user_id):
+        usage_entries[usage.period] = usage
+
+    return UsageRecord(usage_entries.get(USAGE_PERIOD_MONTHLY) or get_usage_entry(usage_user_id, USAGE_PERIOD_MONTHLY, period_time_monthly), 
+                       usage_entries.get(USAGE_PERIOD_DAILY) or get_usage_entry(usage_user_id, USAGE_PERIOD_DAILY, period_time_daily))
+
+
+def get_usage_entry(usage_user_id, period, period_time):
+    # a usage user id can outlive its user (a cached workspace admin, a backfill job), the entry can't be created for it
+    if not User.objects.filter(id=usage_user_id).exists():
+        logger.error(f'usage user {usage_user_id} not found')
+        raise Exception(f'usage user {usage_user_id} not found')
+    # the unique constraint makes this safe when several workers create the entry at the same time
+    usage, created = VocabAiUsage.objects.get_or_create(user_id=usage_user_id, period=period, period_time=period_time, defaults={'characters': 0})
+    return usage
+
+
+def get_usage_user_cache_key(workspace_id):
+    return f'vocabai_usage_user_{workspace_id}'
+
+def get_workspace_usage_user_id(workspace_id):
+    """the usage of a workspace is associated with its admin. returns None if the workspace has no admin"""
+    cache_key = get_usage_user_cache_key(workspace_id)
+    usage_user_id = cache.get(cache_key)
+    if usage_user_id != None:
+        return usage_user_id
+
+    usage_user_id = WorkspaceUser.objects.filter(workspace_id=workspace_id, permissions=WORKSPACE_USER_PERMISSION_ADMIN).values_list('user_id', flat=True).first()
+    if usage_user_id == None:
+        logger.error(f'admin user not found in workspace.id: {workspace_id}')
+        return None
+    logger.debug(f'usage user of workspace {workspace_id}: {usage_user_id}')
+    cache.set(cache_key, usage_user_id, timeout=USAGE_USER_CACHE_TIMEOUT)
+    return usage_user_id
+
+def invalidate_workspace_usage_user_id(workspace_id):
+    cache.delete(get_usage_user_cache_key(workspace_id))
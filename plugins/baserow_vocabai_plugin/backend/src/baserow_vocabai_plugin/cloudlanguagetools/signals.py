@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from baserow.contrib.database.fields.registries import field_type_registry
+from baserow.contrib.database.fields.signals import field_deleted, field_restored
+from baserow.contrib.database.rows.signals import rows_deleted
+from baserow.core.models import WorkspaceUser
+from baserow.core.signals import workspace_user_added, workspace_user_updated, workspace_user_deleted
+
+from . import backfill_jobs
+from . import fingerprints
+from . import quotas
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@receiver(field_deleted)
+def cancel_backfills_of_deleted_field(sender, field_id, **kwargs):
+    # running backfills stop at their next bucket, and nothing gets written to a trashed field
+    backfill_jobs.cancel_backfill_jobs(field_id)
+
+@receiver(field_restored)
+def fill_missing_rows_of_restored_field(sender, field, **kwargs):
+    # rows created while the field was trashed have no value, the others are kept as they were
+    from ..fields.vocabai_fieldtypes import TransformationFieldType
+    field = field.specific
+    field_type = field_type_registry.get_by_model(field)
+    if isinstance(field_type, TransformationFieldType):
+        logger.info(f'field {field.id} restored, populating missing rows')
+        field_type.update_all_rows(field, fill_missing=True)
+
+@receiver(rows_deleted)
+def clear_fingerprints_of_deleted_rows(sender, rows, table, **kwargs):
+    # row ids aren't reused, a restored row just gets recomputed the next time
+    fingerprints.clear_row_fingerprints(table.id, [row.id for row in rows])
+
+@receiver(workspace_user_added)
+@receiver(workspace_user_updated)
+@receiver(workspace_user_deleted)
+def invalidate_workspace_usage_user(sender, workspace_user, **kwargs):
+    # the usage user is the workspace admin, it changes with membership and permissions
+    quotas.invalidate_workspace_usage_user_id(workspace_user.workspace_id)
+
+@receiver(post_delete, sender=WorkspaceUser)
+def invalidate_workspace_usage_user_of_removed_member(sender, instance, **kwargs):
+    # also covers the memberships deleted along with a user, which don't send workspace_user_deleted
+    quotas.invalidate_workspace_usage_user_id(instance.workspace_id)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# identical service calls in flight in several workers at once (a shared template pasted by many users) are only
+# made by the worker which takes the lease, the others wait for the result it publishes, and aren't charged.
+# the lease outlives a stuck call, after SINGLEFLIGHT_WAIT_TIMEOUT the waiters make the call themselves
+SINGLEFLIGHT_LEASE_TIMEOUT = 120
+SINGLEFLIGHT_WAIT_TIMEOUT = int(os.environ.get('VOCABAI_SINGLEFLIGHT_WAIT_TIMEOUT', 30))
+SINGLEFLIGHT_POLL_INTERVAL = 0.2
+# the result only needs to live long enough for the waiters to pick it up
+SINGLEFLIGHT_RESULT_TIMEOUT = 60
+
+
+def get_call_key(operation, service, key, text):
+    """identifies a call across workers: the operation (translation, ...), the service, the language / option key,
+    and the text"""
+    return hashlib.sha256(json.dumps([operation, service, key, text]).encode('utf-8')).hexdigest()
+
+def get_lease_cache_key(call_key):
+    return f'vocabai_singleflight_lease_{call_key}'
+
+def get_result_cache_key(call_key):
+    return f'vocabai_singleflight_result_{call_key}'
+
+
+def lead(items, get_item_call_key):
+    """returns (the items this worker makes the call for, the items another worker is already calling)"""
+    lead_list = []
+    wait_list = []
+    for item in items:
+        if cache.add(get_lease_cache_key(get_item_call_key(item)), True, timeout=SINGLEFLIGHT_LEASE_TIMEOUT):
+            lead_list.append(item)
+        else:
+            wait_list.append(item)
+    return lead_list, wait_list
+
+def publish(items, get_item_call_key, results):
+    """publish the results of the items we had the lease for, and release the leases, including those of the calls
+    which failed: their waiters don't need to wait for the timeout"""
+    if len(items) == 0:
+        return
+    cache.set_many({get_result_cache_key(get_item_call_key(item)): {'result': results[item]} for item in items if item in results},
+                   timeout=SINGLEFLIGHT_RESULT_TIMEOUT)
+    cache.delete_many([get_lease_cache_key(get_item_call_key(item)) for item in items])
+
+def wait(items, get_item_call_key, results):
+    """wait for the results other workers publish, they go into results. returns the items which didn't get one:
+    the call failed, or took longer than SINGLEFLIGHT_WAIT_TIMEOUT"""
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT_TIMEOUT
+    call_keys = {item: get_item_call_key(item) for item in items}
+    pending_items = list(items)
+    while True:
+        published_results = cache.get_many([get_result_cache_key(call_keys[item]) for item in pending_items])
+        for item in pending_items:
+            published_result = published_results.get(get_result_cache_key(call_keys[item]))
+            if published_result != None:
+                results[item] = published_result['result']
+        pending_items = [item for item in pending_items if item not in results]
+        if len(pending_items) == 0:
+            return []
+
+        leases = cache.get_many([get_lease_cache_key(call_keys[item]) for item in pending_items])
+        if len(leases) == 0 or time.monotonic() > deadline:
+            logger.info(f'{len(pending_items)} calls in flight in other workers did not publish a result')
+            return pending_items
+        time.sleep(SINGLEFLIGHT_POLL_INTERVAL)
@@ -1,19 +1,35 @@
 from baserow.config.celery import app
+from celery import group
 
 from baserow.contrib.database.table.models import Table
+from baserow.contrib.database.fields.models import Field
+from baserow.contrib.database.fields.registries import field_type_registry
 from baserow.contrib.database.rows.signals import before_rows_update, rows_updated
 from baserow.contrib.database.table.signals import table_updated
 
 from django.conf import settings
+from celery.exceptions import SoftTimeLimitExceeded
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Length
 import redis
 import json
 
 from . import clt_interface
+from . import translation_memory
+from . import dictionary_memory
+from . import quotas
+from . import backfill_jobs
+from . import fingerprints
 from .quotas import QuotaOverUsage
 from ..fields.vocabai_models import CHOICE_PINYIN, CHOICE_JYUTPING
 
 import os
 import time
+import contextlib
+import functools
+import itertools
+import operator
 import requests
 import pprint
 
@@ -30,78 +46,384 @@ TASK_ITERATION_SIZE_PLAN = [
     [5, 10],
     [5, 100],
     [5, 500],
-    [5, 2000],
-    [5, 200000]
+    [5, 2000]
 ]
 
-def iterate_row_id_buckets(table_id):
-    step_size_array = []
-    for entry in TASK_ITERATION_SIZE_PLAN:
-        count = entry[0]
-        step_size = entry[1]
-        for i in range(0, count):
-            step_size_array.append(step_size)
-
-    # first, collect all row IDs
+BULK_UPDATE_BATCH_SIZE = 1000
+
+# how often the scheduler checks whether deferred or stalled backfills can be resumed
+BACKFILL_RESUME_PERIOD = 60 * 5
+# a backfill task hands over to a new task after this long, well within the celery time limits
+BACKFILL_CHUNK_DURATION = 60 * 5
+# large tables are split in row id ranges, processed in parallel by the cloudlanguagetools workers
+BACKFILL_SHARD_COUNT = int(os.environ.get('VOCABAI_BACKFILL_SHARD_COUNT', os.environ.get('BASEROW_CELERY_CLT_WORKER_NUM', 2)))
+BACKFILL_SHARD_MIN_ROWS = 10000
+# number of distinct source values priced when estimating a backfill in the field create / update request
+BACKFILL_ESTIMATE_SAMPLE_SIZE = 100
+# a scheduled backfill waits this long for the backfills of other fields reading the same source field, so
+# that they can run as a single pass over the table
+BACKFILL_MERGE_DELAY = int(os.environ.get('VOCABAI_BACKFILL_MERGE_DELAY', 5))
+
+def iterate_bucket_sizes(progressive=True):
+    if progressive:
+        for count, step_size in TASK_ITERATION_SIZE_PLAN:
+            for i in range(0, count):
+                yield step_size
+    # past the end of the plan, keep going with the last step size. the buckets stay bounded, so that
+    # we checkpoint regularly
+    yield from itertools.repeat(TASK_ITERATION_SIZE_PLAN[-1][1])
+
+
+def get_field_id(internal_field_name):
+    return int(internal_field_name.replace('field_', ''))
+
+
+def get_table_and_model(table_id, internal_field_names):
+    """returns the table, and a model which only contains the fields we need"""
     base_queryset = Table.objects
     table = base_queryset.select_related("database__workspace").get(id=table_id)
-    # https://docs.djangoproject.com/en/4.0/ref/models/querysets/
-    table_model = table.get_model()
-    row_id_list = []
-    for row in table_model.objects.all():
-        row_id = row.id
-        row_id_list.append(row_id)    
-
-    while len(row_id_list) > 0:
-        iteration_size = step_size_array[0]
-        step_size_array = step_size_array[1:]
-        iteration_row_id_list = row_id_list[0:iteration_size]
-        row_id_list = row_id_list[iteration_size:]
+    field_ids = [get_field_id(internal_field_name) for internal_field_name in internal_field_names]
+    table_model = table.get_model(field_ids=field_ids, add_dependencies=False)
+    return table, table_model
+
+
+def iterate_row_id_buckets(table_model, start_row_id=0, progressive=True, end_row_id=None, row_filter=None):
+    """walk the table by row id (keyset pagination), only ever holding one bucket of ids in memory"""
+
+    row_id_queryset = table_model.objects.order_by('id').values_list('id', flat=True)
+    if end_row_id != None:
+        row_id_queryset = row_id_queryset.filter(id__lte=end_row_id)
+    if row_filter != None:
+        row_id_queryset = row_id_queryset.filter(row_filter)
+
+    last_row_id = start_row_id
+    for iteration_size in iterate_bucket_sizes(progressive):
+        iteration_row_id_list = list(row_id_queryset.filter(id__gt=last_row_id)[:iteration_size])
+        if len(iteration_row_id_list) == 0:
+            return
+        last_row_id = iteration_row_id_list[-1]
         yield iteration_row_id_list
 
 
-def process_row_id_bucket_iterate_rows(table_id, row_id_list):
-
-    base_queryset = Table.objects
-    table = base_queryset.select_related("database__workspace").get(id=table_id)
-    # logger.info(f'table: {table}')
+@contextlib.contextmanager
+def process_row_id_bucket(table, table_model, row_id_list, notify=True):
+    """yields the rows of the bucket, and notifies the frontend once they have been updated"""
 
-    table_model = table.get_model()
+    # a single query for the whole bucket
+    row_list = list(table_model.objects.filter(id__in=row_id_list).order_by('id'))
 
-    row_list = []
-    for row_id in row_id_list:
-        row = table_model.objects.get(id=row_id)
-        row_list.append(row)
+    if not notify:
+        yield row_list
+        return
 
     size_cutoff = 50
 
     if len(row_list) < size_cutoff:
+        # table_model only has the columns we work on, realtime and webhook subscribers get whole rows
+        notify_model = table.get_model()
         before_return = before_rows_update.send(
             None,
-            rows=row_list,
+            rows=list(notify_model.objects.filter(id__in=row_id_list).order_by('id')),
             user=None,
             table=table,
-            model=table_model,
+            model=notify_model,
             updated_field_ids=None,
         )
 
-    for row in row_list:
-        yield row
+    try:
+        yield row_list
+    finally:
+        # notify even if the bucket was only partially processed
+        if len(row_list) < size_cutoff:
+            rows_updated.send(
+                None,
+                rows=list(notify_model.objects.filter(id__in=row_id_list).order_by('id')),
+                user=None,
+                table=table,
+                model=notify_model,
+                before_return=before_return,
+                updated_field_ids=None
+            )
+        else:
+            # refresh whole table
+            table_updated.send(None, table=table, user=None, force_table_refresh=True)
+
+
+class BackfillStats():
+    def __init__(self, backfill_job=None):
+        self.rows = 0
+        self.calls = 0
+        self.calls_saved = 0
+        self.rows_unchanged = 0
+        if backfill_job != None:
+            # carry on counting from the last checkpoint
+            self.rows = backfill_job.rows
+            self.calls = backfill_job.calls
+            self.calls_saved = backfill_job.calls_saved
+
+    def __str__(self):
+        return f'rows: {self.rows} calls: {self.calls} calls saved by dedup: {self.calls_saved} unchanged rows skipped: {self.rows_unchanged}'
+
+
+class TransformedColumn():
+    """the values computed for one target column of a bucket, until they are written back"""
+    def __init__(self, target_field_id, stats, backfill_job=None, config_hash=None):
+        self.target_field_id = target_field_id
+        self.stats = stats
+        self.backfill_job = backfill_job
+        self.config_hash = config_hash
+        self.updated_row_list = []
+        self.source_hashes = {}
+
+
+def compute_column(row_list, source_field_id, column, transform_batch_fn):
+    """group the rows by source value, transform the distinct values in batches with transform_batch_fn,
+    and fan the results out to all the rows sharing that value. when the column has a config_hash, rows which were
+    last computed from the same source value and settings are skipped"""
+    target_field_id = column.target_field_id
+    stats = column.stats
 
-    if len(row_list) < size_cutoff:
-        rows_updated.send(
-            None,
-            rows=row_list,
-            user=None,
-            table=table,
-            model=table_model,
-            before_return=before_return,
-            updated_field_ids=None
-        )
-    else:
-        # refresh whole table
+    for row in row_list:
+        text = getattr(row, source_field_id)
+        if text != None and len(text) > 0:
+            column.source_hashes[row.id] = fingerprints.get_source_hash(text)
+
+    unchanged_row_ids = set()
+    if column.config_hash != None:
+        unchanged_row_ids = fingerprints.get_unchanged_row_ids(get_field_id(target_field_id), column.source_hashes, column.config_hash)
+        # a fingerprint doesn't vouch for a value which has since been cleared
+        unchanged_row_ids = {row.id for row in row_list if row.id in unchanged_row_ids and getattr(row, target_field_id)}
+        stats.rows_unchanged += len(unchanged_row_ids)
+
+    rows_by_value = {}
+    for row in row_list:
+        if row.id in column.source_hashes and row.id not in unchanged_row_ids:
+            rows_by_value.setdefault(getattr(row, source_field_id), []).append(row)
+
+    # results are recorded as they come in, so that they can be written back if a later batch fails
+    for batch in clt_interface.iterate_batches(list(rows_by_value.keys())):
+        result_list = transform_batch_fn(batch)
+        for text, result in zip(batch, result_list):
+            value_row_list = rows_by_value[text]
+            stats.calls += 1
+            stats.calls_saved += len(value_row_list) - 1
+            for row in value_row_list:
+                setattr(row, target_field_id, result)
+            column.updated_row_list.extend(value_row_list)
+
+
+def write_columns(table_model, column_list):
+    """write back whatever we have computed (and possibly paid for), with a single bulk update for all the columns,
+    only touching the target columns"""
+    column_list = [column for column in column_list if len(column.updated_row_list) > 0]
+    if len(column_list) == 0:
+        return
+    with transaction.atomic():
+        active_column_list = []
+        for column in column_list:
+            if column.backfill_job == None or backfill_jobs.lock_active_backfill_job(column.backfill_job):
+                active_column_list.append(column)
+            else:
+                # superseded while we were working on this bucket, the newer backfill owns the column now
+                logger.info(f'backfill job {column.backfill_job.id} is not active anymore, discarding {len(column.updated_row_list)} rows')
+        if len(active_column_list) == 0:
+            return
+
+        updated_rows = {}
+        for column in active_column_list:
+            for row in column.updated_row_list:
+                updated_rows[row.id] = row
+        target_field_id_list = [column.target_field_id for column in active_column_list]
+        table_model.objects.bulk_update(list(updated_rows.values()), fields=target_field_id_list, batch_size=BULK_UPDATE_BATCH_SIZE)
+
+        for column in active_column_list:
+            if column.config_hash != None:
+                fingerprints.store_fingerprints(get_field_id(column.target_field_id),
+                    {row.id: column.source_hashes[row.id] for row in column.updated_row_list}, column.config_hash)
+            column.stats.rows += len(column.updated_row_list)
+
+
+def transform_rows(table_model, row_list, source_field_id, target_field_id, transform_batch_fn, stats, backfill_job=None, config_hash=None):
+    column = TransformedColumn(target_field_id, stats, backfill_job, config_hash)
+    try:
+        compute_column(row_list, source_field_id, column, transform_batch_fn)
+    finally:
+        write_columns(table_model, [column])
+
+
+def get_pending_row_ids(field_id):
+    """the rows of the field which a row update left to run_clt_transformation_rows"""
+    return backfill_jobs.get_pending_row_ids(field_id, run_clt_transformation_rows.name)
+
+
+def get_fill_missing_filter(table_model, source_field_id, target_field_id):
+    """rows which have a source value, but no target value. the rows pending in a job are left to that job"""
+    has_source = ~Q(**{f'{source_field_id}__isnull': True}) & ~Q(**{source_field_id: ''})
+    missing_target = Q(**{f'{target_field_id}__isnull': True}) | Q(**{target_field_id: ''})
+    if isinstance(table_model._meta.get_field(target_field_id), models.JSONField):
+        # json targets (chinese romanization) default to an empty object
+        missing_target = missing_target | Q(**{target_field_id: {}})
+    fill_missing_filter = has_source & missing_target
+    pending_row_ids = get_pending_row_ids(get_field_id(target_field_id))
+    if len(pending_row_ids) > 0:
+        fill_missing_filter = fill_missing_filter & ~Q(id__in=pending_row_ids)
+    return fill_missing_filter
+
+
+def get_backfill_row_queryset(table_model, source_field_id, target_field_id, start_row_id=0, end_row_id=None, fill_missing=False):
+    """the rows of a backfill which have a non-empty source value"""
+    row_queryset = table_model.objects.filter(id__gt=start_row_id).exclude(**{f'{source_field_id}__isnull': True}).exclude(**{source_field_id: ''})
+    if end_row_id != None:
+        row_queryset = row_queryset.filter(id__lte=end_row_id)
+    if fill_missing:
+        row_queryset = row_queryset.filter(get_fill_missing_filter(table_model, source_field_id, target_field_id))
+    return row_queryset.order_by()
+
+
+def estimate_backfill_characters(table_id, source_field_id, target_field_id, cost_fn, start_row_id=0, end_row_id=None, fill_missing=False):
+    """total cost of a backfill, each distinct non-empty source value only gets transformed once"""
+    table, table_model = get_table_and_model(table_id, [source_field_id, target_field_id])
+    row_queryset = get_backfill_row_queryset(table_model, source_field_id, target_field_id, start_row_id, end_row_id, fill_missing)
+    source_value_queryset = row_queryset.values_list(source_field_id, flat=True).distinct()
+    return sum(cost_fn(text) for text in source_value_queryset.iterator(chunk_size=BULK_UPDATE_BATCH_SIZE))
+
+
+def approximate_backfill_characters(table_id, source_field_id, target_field_id, cost_fn, fill_missing=False):
+    """estimate_backfill_characters, bounded to two queries so that it can run in the field create / update request:
+    the total length of the distinct source values, priced at the cost per character of a sample of them. the backfill
+    task computes the exact cost itself"""
+    table, table_model = get_table_and_model(table_id, [source_field_id, target_field_id])
+    row_queryset = get_backfill_row_queryset(table_model, source_field_id, target_field_id, fill_missing=fill_missing)
+    source_value_queryset = row_queryset.values_list(source_field_id, flat=True).distinct()
+    sample_list = list(source_value_queryset[:BACKFILL_ESTIMATE_SAMPLE_SIZE])
+    sample_characters = sum(cost_fn(text) for text in sample_list)
+    if len(sample_list) < BACKFILL_ESTIMATE_SAMPLE_SIZE:
+        # the sample is all there is
+        return sample_characters
+    sample_length = sum(len(text) for text in sample_list)
+    # summed over the distinct values (in a subquery), each value is only transformed once
+    distinct_value_queryset = row_queryset.values(source_field_id).distinct().annotate(length=Length(source_field_id))
+    total_length = distinct_value_queryset.aggregate(total_length=Sum('length'))['total_length'] or 0
+    return round(total_length * sample_characters / sample_length)
+
+
+def reserve_backfill_quota(usage_user_id, estimated_characters, description):
+    """reserve the estimated cost in one step, or whatever is left of the quota"""
+    quota_reservation = quotas.reserve_quota(usage_user_id, estimated_characters)
+    if quota_reservation.reserved_characters < estimated_characters:
+        logger.warning(f'{description}: estimated {estimated_characters} characters, '
+                       f'only {quota_reservation.reserved_characters} available for user {usage_user_id}, the backfill will be partial')
+    return quota_reservation
+
+
+def get_shard_row_ranges(table_id):
+    """split the table in (after row id, up to row id) ranges with a similar number of rows, or returns
+    an empty list if the table is too small to be worth it"""
+    table, table_model = get_table_and_model(table_id, [])
+    row_id_queryset = table_model.objects.order_by('id').values_list('id', flat=True)
+    row_count = row_id_queryset.count()
+    shard_count = min(BACKFILL_SHARD_COUNT, row_count // BACKFILL_SHARD_MIN_ROWS)
+    if shard_count <= 1:
+        return []
+    boundary_list = [0] + [row_id_queryset[row_count * i // shard_count - 1] for i in range(1, shard_count)] + [row_id_queryset.last()]
+    return list(zip(boundary_list[:-1], boundary_list[1:]))
+
+
+def start_backfill(task, table_id, target_field_id, usage_user_id, backfill_job_id, backfill_attempt):
+    """returns the job this task works on, or None if there is nothing left for this task to do: the job was
+    superseded or handed to another attempt, or the table was split in shards which run as separate tasks"""
+    backfill_job = backfill_jobs.start_backfill_job(task, get_field_id(target_field_id), usage_user_id, backfill_job_id, backfill_attempt)
+    # only a backfill which starts from the first row gets split, not a continuation or a shard
+    if backfill_job == None or backfill_job.last_row_id != 0 or backfill_job.end_row_id != None:
+        return backfill_job
+
+    shard_row_ranges = get_shard_row_ranges(table_id)
+    if len(shard_row_ranges) == 0:
+        return backfill_job
+
+    logger.info(f'splitting backfill of table_id: {table_id} target_field_id: {target_field_id} in {len(shard_row_ranges)} shards')
+    shard_job_list = backfill_jobs.create_shard_backfill_jobs(backfill_job, shard_row_ranges)
+    group(get_backfill_job_signature(shard_job) for shard_job in shard_job_list).apply_async()
+    return None
+
+
+def run_backfill(task, backfill_job, description, table_id, source_field_id, target_field_id, usage_user_id, transform_batch_fn, 
+                 quota_reservation=None, config_hash=None, fill_missing=False):
+    # the backfill is broken up in buckets, so that we can notify the user about work in progress, and checkpoint
+    # after each one. after BACKFILL_CHUNK_DURATION, the rest of the table is left to a new task
+    stats = BackfillStats(backfill_job)
+    deadline = time.monotonic() + BACKFILL_CHUNK_DURATION
+    # shards don't notify for each bucket, the last one to stop refreshes the whole table
+    sharded = backfill_job.end_row_id != None
+    # a continuation goes straight to full size buckets
+    progressive = backfill_job.last_row_id == 0 and not sharded
+    continue_backfill = False
+    cancelled = False
+    last_running_shard = False
+    # recorded along with the job, so that the scheduler can give it back if this worker dies
+    reserved_characters = None
+    if quota_reservation != None:
+        reserved_characters = quota_reservation.get_unused_characters()
+        backfill_jobs.store_reserved_characters(backfill_job, reserved_characters)
+    try:
+        table, table_model = get_table_and_model(table_id, [source_field_id, target_field_id])
+        # in fill missing mode, the database only returns the rows which need work
+        row_filter = None
+        if fill_missing:
+            row_filter = get_fill_missing_filter(table_model, source_field_id, target_field_id)
+        for row_id_list in iterate_row_id_buckets(table_model, backfill_job.last_row_id, progressive, backfill_job.end_row_id, row_filter):
+            with process_row_id_bucket(table, table_model, row_id_list, notify=not sharded) as row_list:
+                transform_rows(table_model, row_list, source_field_id, target_field_id, transform_batch_fn, stats, backfill_job, config_hash)
+            if quota_reservation != None:
+                reserved_characters = quota_reservation.get_unused_characters()
+            if not backfill_jobs.checkpoint_backfill_job(backfill_job, row_id_list[-1], stats, reserved_characters):
+                logger.info(f'{description} table_id: {table_id} target_field_id: {target_field_id} was superseded or cancelled, stopping')
+                cancelled = True
+                break
+            if time.monotonic() > deadline:
+                continue_backfill = True
+                break
+        if not continue_backfill and not cancelled:
+            last_running_shard = backfill_jobs.finish_backfill_job(backfill_job) and sharded
+    except QuotaOverUsage:
+        logger.warning(f'could not complete {description} for user {usage_user_id}, deferring the remaining rows')
+        # the bucket which was interrupted gets redone when resuming
+        remaining_characters = quota_reservation.get_remaining_characters() if quota_reservation != None else None
+        last_running_shard = backfill_jobs.defer_backfill_job(backfill_job, remaining_characters) and sharded
+    except SoftTimeLimitExceeded:
+        logger.warning(f'{description} reached the time limit, continuing after row id {backfill_job.last_row_id}')
+        continue_backfill = True
+    except Exception:
+        # a service error, or bad data. the scheduler retries the job from its checkpoint, a limited number of times
+        logger.exception(f'{description} table_id: {table_id} target_field_id: {target_field_id} failed after row id {backfill_job.last_row_id}')
+        remaining_characters = quota_reservation.get_remaining_characters() if quota_reservation != None else None
+        backfill_jobs.fail_backfill_job(backfill_job, remaining_characters)
+        raise
+    finally:
+        if quota_reservation != None:
+            # give back what we didn't use
+            quota_reservation.release()
+            backfill_jobs.store_reserved_characters(backfill_job, 0)
+            logger.info(f'{description} table_id: {table_id} target_field_id: {target_field_id} {quota_reservation}')
+    logger.info(f'{description} table_id: {table_id} target_field_id: {target_field_id} {stats}')
+
+    if last_running_shard:
+        # one refresh for the whole backfill
         table_updated.send(None, table=table, user=None, force_table_refresh=True)
 
+    if continue_backfill:
+        # chain the next chunk right away, it continues from the checkpoint
+        dispatch_backfill_job(backfill_job)
+
+
+def get_backfill_job_signature(backfill_job):
+    task_kwargs = {**backfill_job.task_kwargs, 'backfill_job_id': backfill_job.id, 'backfill_attempt': backfill_job.attempt}
+    return app.tasks[backfill_job.task_name].signature(args=backfill_job.task_args, kwargs=task_kwargs)
+
+
+def dispatch_backfill_job(backfill_job):
+    get_backfill_job_signature(backfill_job).apply_async()
+
 
 # translation 
 # ===========
@@ -112,20 +434,21 @@ def process_row_id_bucket_iterate_rows(table_id, row_id_list):
     soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
     time_limit=EXPORT_TIME_LIMIT,
 )
-def run_clt_translation_all_rows(self, table_id, source_language, target_language, service, source_field_id, target_field_id, usage_user_id):
-    # populating all rows is still a single celery task, but we break it up so that we can notify the user
-    # about work in progress
+def run_clt_translation_all_rows(self, table_id, source_language, target_language, service, source_field_id, target_field_id, usage_user_id, 
+                                 estimated_characters=None, backfill_job_id=None, config_hash=None, fill_missing=False, backfill_attempt=0):
+    backfill_job = start_backfill(self, table_id, target_field_id, usage_user_id, backfill_job_id, backfill_attempt)
+    if backfill_job == None:
+        return
+    if estimated_characters == None:
+        estimated_characters = estimate_backfill_characters(table_id, source_field_id, target_field_id,
+            lambda text: clt_interface.get_translation_cost(text, service),
+            backfill_job.last_row_id, backfill_job.end_row_id, fill_missing)
+    quota_reservation = reserve_backfill_quota(usage_user_id, estimated_characters, 'translation')
 
-    try:
-        for row_id_list in iterate_row_id_buckets(table_id):
-            for row in process_row_id_bucket_iterate_rows(table_id, row_id_list):
-                text = getattr(row, source_field_id)
-                if text != None and len(text) > 0:
-                    translated_text = clt_interface.get_translation(text, source_language, target_language, service, usage_user_id)
-                    setattr(row, target_field_id, translated_text)
-                    row.save()
-    except QuotaOverUsage:
-        logger.exception(f'could not complete translation for user {usage_user_id}')
+    def translate(texts):
+        return clt_interface.get_translation_batch(texts, source_language, target_language, service, usage_user_id, quota_reservation)
+
+    run_backfill(self, backfill_job, 'translation', table_id, source_field_id, target_field_id, usage_user_id, translate, quota_reservation, config_hash, fill_missing)
 
 
 
@@ -138,17 +461,21 @@ def run_clt_translation_all_rows(self, table_id, source_language, target_languag
     soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
     time_limit=EXPORT_TIME_LIMIT,
 )
-def run_clt_transliteration_all_rows(self, table_id, transliteration_id, source_field_id, target_field_id, usage_user_id):
-    try:
-        for row_id_list in iterate_row_id_buckets(table_id):
-            for row in process_row_id_bucket_iterate_rows(table_id, row_id_list):
-                text = getattr(row, source_field_id)
-                if text != None and len(text) > 0:
-                    result = clt_interface.get_transliteration(text, transliteration_id, usage_user_id)
-                    setattr(row, target_field_id, result)
-                    row.save()
-    except QuotaOverUsage:
-        logger.exception(f'could not complete transliteration for user {usage_user_id}')
+def run_clt_transliteration_all_rows(self, table_id, transliteration_id, source_field_id, target_field_id, usage_user_id, 
+                                     estimated_characters=None, backfill_job_id=None, config_hash=None, fill_missing=False, backfill_attempt=0):
+    backfill_job = start_backfill(self, table_id, target_field_id, usage_user_id, backfill_job_id, backfill_attempt)
+    if backfill_job == None:
+        return
+    if estimated_characters == None:
+        estimated_characters = estimate_backfill_characters(table_id, source_field_id, target_field_id,
+            lambda text: clt_interface.get_transliteration_cost(text, transliteration_id),
+            backfill_job.last_row_id, backfill_job.end_row_id, fill_missing)
+    quota_reservation = reserve_backfill_quota(usage_user_id, estimated_characters, 'transliteration')
+
+    def transliterate(texts):
+        return clt_interface.get_transliteration_batch(texts, transliteration_id, usage_user_id, quota_reservation)
+
+    run_backfill(self, backfill_job, 'transliteration', table_id, source_field_id, target_field_id, usage_user_id, transliterate, quota_reservation, config_hash, fill_missing)
 
 # dictionary lookup
 # =================
@@ -159,17 +486,21 @@ def run_clt_transliteration_all_rows(self, table_id, transliteration_id, source_
     soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
     time_limit=EXPORT_TIME_LIMIT,
 )
-def run_clt_lookup_all_rows(self, table_id, lookup_id, source_field_id, target_field_id, usage_user_id):
-    try:
-        for row_id_list in iterate_row_id_buckets(table_id):
-            for row in process_row_id_bucket_iterate_rows(table_id, row_id_list):
-                text = getattr(row, source_field_id)
-                if text != None and len(text) > 0:
-                    result = clt_interface.get_dictionary_lookup(text, lookup_id, usage_user_id)
-                    setattr(row, target_field_id, result)
-                    row.save()        
-    except QuotaOverUsage:
-        logger.exception(f'could not complete dictionary lookup for user {usage_user_id}')
+def run_clt_lookup_all_rows(self, table_id, lookup_id, source_field_id, target_field_id, usage_user_id, 
+                            estimated_characters=None, backfill_job_id=None, config_hash=None, fill_missing=False, backfill_attempt=0):
+    backfill_job = start_backfill(self, table_id, target_field_id, usage_user_id, backfill_job_id, backfill_attempt)
+    if backfill_job == None:
+        return
+    if estimated_characters == None:
+        estimated_characters = estimate_backfill_characters(table_id, source_field_id, target_field_id,
+            lambda text: clt_interface.get_dictionary_lookup_cost(text, lookup_id),
+            backfill_job.last_row_id, backfill_job.end_row_id, fill_missing)
+    quota_reservation = reserve_backfill_quota(usage_user_id, estimated_characters, 'dictionary lookup')
+
+    def lookup(texts):
+        return clt_interface.get_dictionary_lookup_batch(texts, lookup_id, usage_user_id, quota_reservation)
+
+    run_backfill(self, backfill_job, 'dictionary lookup', table_id, source_field_id, target_field_id, usage_user_id, lookup, quota_reservation, config_hash, fill_missing)
 
 
 # chinese romanization
@@ -181,23 +512,256 @@ def run_clt_lookup_all_rows(self, table_id, lookup_id, source_field_id, target_f
     soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
     time_limit=EXPORT_TIME_LIMIT,
 )
-def run_clt_chinese_romanization_all_rows(self, table_id, romanization_type, tone_numbers, spaces, source_field_id, target_field_id, usage_user_id):
+def run_clt_chinese_romanization_all_rows(self, table_id, romanization_type, tone_numbers, spaces, source_field_id, target_field_id, usage_user_id, 
+                                          backfill_job_id=None, config_hash=None, fill_missing=False, backfill_attempt=0):
+    backfill_job = start_backfill(self, table_id, target_field_id, usage_user_id, backfill_job_id, backfill_attempt)
+    if backfill_job == None:
+        return
+
+    def romanize(texts):
+        result_list = []
+        for text in texts:
+            if romanization_type == CHOICE_PINYIN:
+                result = clt_interface.get_pinyin(text, tone_numbers, spaces)
+            elif romanization_type == CHOICE_JYUTPING:
+                result = clt_interface.get_jyutping(text, tone_numbers, spaces)
+            logger.debug(f'computed romanization: {pprint.pformat(result)}')
+            result_list.append(result)
+        return result_list
+
+    # free, no quota involved
+    run_backfill(self, backfill_job, 'chinese romanization', table_id, source_field_id, target_field_id, usage_user_id, romanize,
+                 config_hash=config_hash, fill_missing=fill_missing)
+
+
+
+# merged backfills
+# ================
+
+def schedule_backfill(field, usage_user_id, task, args, kwargs):
+    """record the backfill of a field in the job ledger, it's dispatched BACKFILL_MERGE_DELAY after the transaction
+    commits. the backfills of fields reading the same source field which get scheduled in the meantime (several
+    fields created or edited one after the other) are merged into a single pass over the table"""
+    backfill_job = backfill_jobs.schedule_backfill_job(field.id, task.name, list(args), kwargs, usage_user_id)
+    if backfill_job == None:
+        return
+    # a rolled back transaction takes the job with it, and never dispatches
+    table_id = field.table_id
+    transaction.on_commit(lambda: dispatch_scheduled_backfills_later(table_id))
+
+
+def dispatch_scheduled_backfills_later(table_id):
+    dispatch_scheduled_backfills.apply_async((table_id,), countdown=BACKFILL_MERGE_DELAY)
+
+
+@app.task(queue='cloudlanguagetools')
+def dispatch_scheduled_backfills(table_id):
+    """start the backfills scheduled in the table. the first dispatch after a burst of updates takes all of them,
+    the following ones find nothing left to do"""
+    scheduled_job_lists = {}
+    for backfill_job in backfill_jobs.take_scheduled_backfill_jobs(table_id):
+        source_field_id = backfill_job.field.specific.source_field_id
+        scheduled_job_lists.setdefault(source_field_id, []).append(backfill_job)
+    if len(scheduled_job_lists) == 0:
+        return
+    # large tables are better served by sharding each of the backfills across the workers
+    sharded = len(get_shard_row_ranges(table_id)) > 0
+    for source_field_id, backfill_job_list in scheduled_job_lists.items():
+        if len(backfill_job_list) == 1 or sharded:
+            group(get_backfill_job_signature(backfill_job) for backfill_job in backfill_job_list).apply_async()
+            continue
+        logger.info(f'merging backfills of fields {[backfill_job.field_id for backfill_job in backfill_job_list]} in table_id: {table_id}')
+        run_clt_table_all_rows.delay(table_id, f'field_{source_field_id}', backfill_job_list[0].usage_user_id,
+            backfill_job_ids=[backfill_job.id for backfill_job in backfill_job_list],
+            backfill_attempts=[backfill_job.attempt for backfill_job in backfill_job_list])
+
+
+class FieldBackfill():
+    """one of the fields populated by a merged backfill, transformed through its field type"""
+    def __init__(self, backfill_job):
+        self.backfill_job = backfill_job
+        self.field = Field.objects_and_trash.get(id=backfill_job.field_id).specific
+        self.field_type = field_type_registry.get_by_model(self.field)
+        self.target_field_id = f'field_{self.field.id}'
+        self.config_hash = backfill_job.task_kwargs.get('config_hash')
+        self.fill_missing = backfill_job.task_kwargs.get('fill_missing', False)
+        self.pending_row_ids = get_pending_row_ids(self.field.id) if self.fill_missing else set()
+        self.stats = BackfillStats(backfill_job)
+
+    def get_cost(self, text):
+        return self.field_type.get_transformation_cost(self.field, text)
+
+    def get_pending_rows(self, row_list):
+        """the rows of the bucket which this field still has to go through"""
+        row_list = [row for row in row_list if row.id > self.backfill_job.last_row_id]
+        if self.fill_missing:
+            row_list = [row for row in row_list if not getattr(row, self.target_field_id) and row.id not in self.pending_row_ids]
+        return row_list
+
+
+def transform_bucket(table_model, row_list, source_field_id, field_backfill_list, usage_user_id, quota_reservation):
+    """compute all the columns of a bucket, and write them back together. returns the fields which ran out of quota,
+    the other fields carry on"""
+    column_list = []
+    over_quota_list = []
     try:
-        logger.debug(f'running run_clt_chinese_romanization_all_rows')
-        for row_id_list in iterate_row_id_buckets(table_id):
-            for row in process_row_id_bucket_iterate_rows(table_id, row_id_list):
-                text = getattr(row, source_field_id)
-                if text != None and len(text) > 0:
-                    if romanization_type == CHOICE_PINYIN:
-                        result = clt_interface.get_pinyin(text, tone_numbers, spaces)
-                    elif romanization_type == CHOICE_JYUTPING:
-                        result = clt_interface.get_jyutping(text, tone_numbers, spaces)
-                    logger.debug(f'computed romanization: {pprint.pformat(result)}')
-                    setattr(row, target_field_id, result)
-                    row.save()        
-    except QuotaOverUsage:
-        logger.exception(f'could not complete chinese romanization for user {usage_user_id}')
+        for field_backfill in field_backfill_list:
+            column = TransformedColumn(field_backfill.target_field_id, field_backfill.stats, field_backfill.backfill_job, field_backfill.config_hash)
+            column_list.append(column)
+            def transform(texts):
+                return field_backfill.field_type.transform_values(field_backfill.field, texts, usage_user_id, quota_reservation)
+            try:
+                compute_column(field_backfill.get_pending_rows(row_list), source_field_id, column, transform)
+            except QuotaOverUsage:
+                logger.warning(f'could not complete backfill of {field_backfill.target_field_id} for user {usage_user_id}, deferring the remaining rows')
+                over_quota_list.append(field_backfill)
+    finally:
+        write_columns(table_model, column_list)
+    return over_quota_list
+
+
+def run_table_backfill(table_id, source_field_id, usage_user_id, backfill_job_list):
+    # a single pass over the table for all the fields: each bucket is read once, written with one bulk update, and
+    # notified once. every field keeps its own job, checkpointed after each bucket
+    field_backfill_list = [FieldBackfill(backfill_job) for backfill_job in backfill_job_list]
+    estimated_characters = sum(estimate_backfill_characters(table_id, source_field_id, field_backfill.target_field_id, field_backfill.get_cost,
+        field_backfill.backfill_job.last_row_id, fill_missing=field_backfill.fill_missing)
+        for field_backfill in field_backfill_list if field_backfill.field_type.remote_transformation)
+    quota_reservation = reserve_backfill_quota(usage_user_id, estimated_characters, 'merged backfill')
+    # the reservation is shared, it's recorded along with the first job which is still running
+    backfill_jobs.store_reserved_characters(field_backfill_list[0].backfill_job, quota_reservation.get_unused_characters())
+
+    deadline = time.monotonic() + BACKFILL_CHUNK_DURATION
+    start_row_id = min(field_backfill.backfill_job.last_row_id for field_backfill in field_backfill_list)
+    progressive = start_row_id == 0
+    continue_backfill = False
+    try:
+        table, table_model = get_table_and_model(table_id, [source_field_id] + [field_backfill.target_field_id for field_backfill in field_backfill_list])
+        row_filter = None
+        if all(field_backfill.fill_missing for field_backfill in field_backfill_list):
+            row_filter = functools.reduce(operator.or_, [get_fill_missing_filter(table_model, source_field_id, field_backfill.target_field_id)
+                                                         for field_backfill in field_backfill_list])
+        for row_id_list in iterate_row_id_buckets(table_model, start_row_id, progressive, row_filter=row_filter):
+            with process_row_id_bucket(table, table_model, row_id_list) as row_list:
+                over_quota_list = transform_bucket(table_model, row_list, source_field_id, field_backfill_list, usage_user_id, quota_reservation)
+            for field_backfill in over_quota_list:
+                # the bucket which was interrupted gets redone when resuming. the reservation is shared between the
+                # fields, the remaining cost of each is estimated from its checkpoint
+                remaining_characters = estimate_backfill_characters(table_id, source_field_id, field_backfill.target_field_id, field_backfill.get_cost,
+                    field_backfill.backfill_job.last_row_id, fill_missing=field_backfill.fill_missing)
+                backfill_jobs.defer_backfill_job(field_backfill.backfill_job, remaining_characters)
+            checkpointed_list = []
+            for field_backfill in field_backfill_list:
+                if field_backfill in over_quota_list:
+                    continue
+                reserved_characters = quota_reservation.get_unused_characters() if len(checkpointed_list) == 0 else 0
+                if backfill_jobs.checkpoint_backfill_job(field_backfill.backfill_job, row_id_list[-1], field_backfill.stats, reserved_characters):
+                    checkpointed_list.append(field_backfill)
+            field_backfill_list = checkpointed_list
+            if len(field_backfill_list) == 0:
+                break
+            if time.monotonic() > deadline:
+                continue_backfill = True
+                break
+        if not continue_backfill:
+            for field_backfill in field_backfill_list:
+                backfill_jobs.finish_backfill_job(field_backfill.backfill_job)
+    except SoftTimeLimitExceeded:
+        logger.warning(f'merged backfill of table_id: {table_id} reached the time limit, continuing from the last checkpoint')
+        continue_backfill = True
+    except Exception:
+        logger.exception(f'merged backfill of table_id: {table_id} failed')
+        for field_backfill in field_backfill_list:
+            backfill_jobs.fail_backfill_job(field_backfill.backfill_job)
+        raise
+    finally:
+        # give back what we didn't use
+        quota_reservation.release()
+        for field_backfill in field_backfill_list:
+            backfill_jobs.store_reserved_characters(field_backfill.backfill_job, 0)
+            logger.info(f'merged backfill table_id: {table_id} target_field_id: {field_backfill.target_field_id} {field_backfill.stats}')
+
+    if continue_backfill and len(field_backfill_list) > 0:
+        run_clt_table_all_rows.delay(table_id, source_field_id, usage_user_id,
+            backfill_job_ids=[field_backfill.backfill_job.id for field_backfill in field_backfill_list],
+            backfill_attempts=[field_backfill.backfill_job.attempt for field_backfill in field_backfill_list])
+
 
+# noinspection PyUnusedLocal
+@app.task(
+    bind=True,
+    soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
+    time_limit=EXPORT_TIME_LIMIT,
+)
+def run_clt_table_all_rows(self, table_id, source_field_id, usage_user_id, backfill_job_ids, backfill_attempts):
+    """populate several fields which read the same source field, see dispatch_scheduled_backfills"""
+    backfill_job_list = backfill_jobs.continue_backfill_jobs(backfill_job_ids, backfill_attempts)
+    if len(backfill_job_list) == 0:
+        return
+    run_table_backfill(table_id, source_field_id, usage_user_id, backfill_job_list)
+
+
+# edited rows
+# ===========
+
+# noinspection PyUnusedLocal
+@app.task(
+    bind=True,
+    soft_time_limit=EXPORT_SOFT_TIME_LIMIT,
+    time_limit=EXPORT_TIME_LIMIT,
+)
+def run_clt_transformation_rows(self, field_id, row_ids, backfill_job_id=None, backfill_attempt=0):
+    """compute the rows which a row update has left pending, see ASYNC_ROW_UPDATES. the pending rows are recorded
+    in the job's arguments. the rows left over when the quota runs out are deferred along with the job, which the
+    scheduler resumes with this task"""
+    field = Field.objects.filter(id=field_id).first()
+    if field == None:
+        logger.info(f'field {field_id} was deleted, not computing rows {row_ids}')
+        return
+    backfill_job = None
+    if backfill_job_id != None:
+        backfill_job = backfill_jobs.continue_backfill_job(field_id, backfill_job_id, backfill_attempt)
+        if backfill_job == None:
+            return
+    field = field.specific
+    field_type = field_type_registry.get_by_model(field)
+
+    table, table_model = get_table_and_model(field.table_id, [f'field_{field.source_field_id}', f'field_{field.id}'])
+    stats = BackfillStats(backfill_job)
+    # large imports are written and pushed to the frontend bucket by bucket
+    for i in range(0, len(row_ids), BULK_UPDATE_BATCH_SIZE):
+        row_id_list = row_ids[i:i + BULK_UPDATE_BATCH_SIZE]
+        try:
+            with process_row_id_bucket(table, table_model, row_id_list) as row_list:
+                updated_row_list = field_type.process_pending_rows(field, table_model, row_list)
+        except QuotaOverUsage as e:
+            logger.info(f'could not compute pending rows of field {field_id}: {e}, deferring the remaining rows')
+            defer_pending_rows(self, field, field_type, table_model, row_ids[i:], backfill_job)
+            return
+        except Exception:
+            if backfill_job != None:
+                # retried by the scheduler, a limited number of times
+                backfill_jobs.fail_backfill_job(backfill_job)
+            raise
+        logger.info(f'computed {len(updated_row_list)} pending rows of field {field_id}')
+        stats.rows += len(updated_row_list)
+        if backfill_job != None and not backfill_jobs.checkpoint_backfill_job(backfill_job, row_id_list[-1], stats):
+            logger.info(f'pending rows of field {field_id} were cancelled or handed to another attempt, stopping')
+            return
+    if backfill_job != None:
+        backfill_jobs.finish_backfill_job(backfill_job)
+
+
+def defer_pending_rows(task, field, field_type, table_model, row_ids, backfill_job):
+    """leave the pending rows to the scheduler, which resumes them once the quota allows"""
+    source_field_id = f'field_{field.source_field_id}'
+    source_value_queryset = table_model.objects.filter(id__in=row_ids).exclude(**{f'{source_field_id}__isnull': True}).exclude(**{source_field_id: ''})
+    source_values = source_value_queryset.order_by().values_list(source_field_id, flat=True).distinct()
+    remaining_characters = sum(field_type.get_transformation_cost(field, source_value) for source_value in source_values)
+    if backfill_job == None:
+        backfill_jobs.create_deferred_backfill_job(field.id, task.name, [field.id, row_ids], field_type.get_usage_user_id(field), remaining_characters)
+    else:
+        backfill_jobs.defer_backfill_job(backfill_job, remaining_characters, task_args=[field.id, row_ids])
 
 
 # retrieving language data
@@ -220,6 +784,11 @@ def setup_periodic_tasks(sender, **kwargs):
     # run once at startup
     collect_user_data.delay()
 
+    sender.add_periodic_task(3600 * 24, evict_translation_memory.s(), name='evict translation memory')
+    sender.add_periodic_task(3600 * 24, evict_dictionary_memory.s(), name='evict dictionary memory')
+
+    sender.add_periodic_task(BACKFILL_RESUME_PERIOD, resume_backfill_jobs.s(), name='resume backfill jobs')
+
 
 # we want to auto-retry on requests.exceptions.ReadTimeout
 @app.task(autoretry_for=(requests.exceptions.ReadTimeout,), retry_kwargs={'max_retries': 5}, queue='cloudlanguagetools')
@@ -228,6 +797,32 @@ def refresh_cloudlanguagetools_language_data():
     clt_interface.update_language_data()
 
 
+@app.task(queue='cloudlanguagetools')
+def evict_translation_memory():
+    logger.info('evict_translation_memory')
+    translation_memory.evict_translation_memory()
+
+
+@app.task(queue='cloudlanguagetools')
+def evict_dictionary_memory():
+    logger.info('evict_dictionary_memory')
+    dictionary_memory.evict_dictionary_memory()
+
+
+@app.task(queue='cloudlanguagetools')
+def resume_backfill_jobs():
+    # once the daily / monthly quota period rolls over, pick up the rows which were left unpopulated.
+    # the resumed task only reserves what's left of the allowance, and gets deferred again if it runs out
+    for backfill_job in backfill_jobs.take_resumable_backfill_jobs():
+        logger.info(f'resuming deferred backfill of field {backfill_job.field_id} after row id {backfill_job.last_row_id}')
+        dispatch_backfill_job(backfill_job)
+
+    # jobs whose worker went away (restart, deploy, time limit kill) continue from their last checkpoint
+    for backfill_job in backfill_jobs.take_stalled_backfill_jobs():
+        logger.info(f'restarting stalled backfill of field {backfill_job.field_id} after row id {backfill_job.last_row_id}')
+        dispatch_backfill_job(backfill_job)
+
+
 # collecting user data
 # ====================
 
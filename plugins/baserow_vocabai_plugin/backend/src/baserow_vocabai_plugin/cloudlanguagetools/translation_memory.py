@@ -0,0 +1,92 @@
+import datetime
+import hashlib
+import logging
+import os
+import unicodedata
+
+from django.utils import timezone
+
+from ..fields.vocabai_models import VocabAiTranslationMemory
+
+logger = logging.getLogger(__name__)
+
+# entries older than this are not served anymore, and get deleted by the eviction task
+TRANSLATION_MEMORY_TTL_DAYS = int(os.environ.get('VOCABAI_TRANSLATION_MEMORY_TTL_DAYS', 90))
+# maximum number of entries kept, the oldest ones get evicted first
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get('VOCABAI_TRANSLATION_MEMORY_MAX_ENTRIES', 1000000))
+# don't memorize long paragraphs, they are unlikely to be repeated
+TRANSLATION_MEMORY_MAX_TEXT_LENGTH = 500
+
+
+def normalize_text(text):
+    # collapse whitespace, and use a consistent unicode representation
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def get_text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+def is_cacheable(text):
+    return len(text) <= TRANSLATION_MEMORY_MAX_TEXT_LENGTH
+
+def get_expiry_cutoff():
+    return timezone.now() - datetime.timedelta(days=TRANSLATION_MEMORY_TTL_DAYS)
+
+
+def lookup_translations(texts, service, source_language_id, target_language_id):
+    """returns a dict text -> memorized translation, for the texts we have a translation for"""
+    texts_by_hash = {}
+    for text in texts:
+        if is_cacheable(text):
+            texts_by_hash.setdefault(get_text_hash(text), []).append(text)
+    if len(texts_by_hash) == 0:
+        return {}
+
+    entries = VocabAiTranslationMemory.objects.filter(
+        text_hash__in=list(texts_by_hash.keys()),
+        service=service,
+        source_language_id=source_language_id,
+        target_language_id=target_language_id,
+        created_time__gte=get_expiry_cutoff()
+    ).values_list('text_hash', 'translated_text')
+
+    results = {}
+    for text_hash, translated_text in entries:
+        for text in texts_by_hash[text_hash]:
+            results[text] = translated_text
+    return results
+
+
+def store_translations(translated_texts, service, source_language_id, target_language_id):
+    """translated_texts is a dict text -> translation"""
+    entries = {}
+    for text, translated_text in translated_texts.items():
+        if is_cacheable(text) and translated_text != None:
+            entries[get_text_hash(text)] = translated_text
+    if len(entries) == 0:
+        return
+
+    key = {
+        'service': service,
+        'source_language_id': source_language_id,
+        'target_language_id': target_language_id
+    }
+    # replace expired entries which haven't been evicted yet
+    VocabAiTranslationMemory.objects.filter(text_hash__in=list(entries.keys()), **key).delete()
+    now = timezone.now()
+    VocabAiTranslationMemory.objects.bulk_create([
+        VocabAiTranslationMemory(text_hash=text_hash, translated_text=translated_text, created_time=now, **key)
+        for text_hash, translated_text in entries.items()
+    ], ignore_conflicts=True)
+
+
+def evict_translation_memory():
+    # remove expired entries
+    expired_count, _ = VocabAiTranslationMemory.objects.filter(created_time__lt=get_expiry_cutoff()).delete()
+
+    # enforce size limit, oldest entries go first
+    evicted_count = 0
+    oldest_kept = VocabAiTranslationMemory.objects.order_by('-created_time').values_list('created_time', flat=True)[TRANSLATION_MEMORY_MAX_ENTRIES:TRANSLATION_MEMORY_MAX_ENTRIES + 1]
+    if len(oldest_kept) == 1:
+        evicted_count, _ = VocabAiTranslationMemory.objects.filter(created_time__lte=oldest_kept[0]).delete()
+
+    logger.info(f'translation memory eviction: {expired_count} expired, {evicted_count} over size limit')
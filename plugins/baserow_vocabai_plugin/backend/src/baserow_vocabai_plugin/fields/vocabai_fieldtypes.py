@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from baserow.contrib.database.fields.field_cache import FieldCache
 
@@ -11,8 +11,6 @@ from baserow.contrib.database.views.handler import ViewHandler
 from baserow.contrib.database.fields.dependencies.models import FieldDependency
 from baserow.contrib.database.table.models import TableModelQuerySet
 
-from baserow.core.models import WORKSPACE_USER_PERMISSION_ADMIN, WorkspaceUser
-
 from baserow.contrib.database.fields.field_filters import (
     contains_filter,
     contains_word_filter,
@@ -21,9 +19,14 @@ from baserow.contrib.database.formula import BaserowFormulaType, BaserowFormulaT
 
 from .vocabai_models import TranslationField, TransliterationField, LanguageField, DictionaryLookupField, ChineseRomanizationField, CHOICE_PINYIN, CHOICE_JYUTPING
 
-from ..cloudlanguagetools.tasks import run_clt_translation_all_rows, run_clt_transliteration_all_rows, run_clt_lookup_all_rows, run_clt_chinese_romanization_all_rows
+from ..cloudlanguagetools.tasks import run_clt_translation_all_rows, run_clt_transliteration_all_rows, run_clt_lookup_all_rows, run_clt_chinese_romanization_all_rows, approximate_backfill_characters
+from ..cloudlanguagetools.tasks import run_clt_transformation_rows, schedule_backfill, dispatch_backfill_job
 from ..cloudlanguagetools import clt_interface
+from ..cloudlanguagetools import quotas
+from ..cloudlanguagetools import fingerprints
+from ..cloudlanguagetools import backfill_jobs
 
+import os
 import logging
 import pprint
 logger = logging.getLogger(__name__)
@@ -33,6 +36,15 @@ logger = logging.getLogger(__name__)
 # however this will require a baserow update, and it's more complicated to do when this code is running as a baserow plugin.
 USE_ENHANCED_UPDATE_COLLECTOR = False
 
+# when enabled, edited rows of remote transformations (translation, transliteration, dictionary lookup) are computed
+# by a celery task, so that the row update doesn't wait on the cloudlanguagetools services. the target cell stays
+# empty until the task writes the result, which reaches the frontend over the realtime channel. the pending rows are
+# recorded in a backfill job
+ASYNC_ROW_UPDATES = os.environ.get('VOCABAI_ASYNC_ROW_UPDATES', 'no') == 'yes'
+# rows created or pasted in bulk (batch create, import) are always computed by the celery task when they have more
+# distinct values than this, so that a large paste doesn't hold the request until all the service calls are done
+ASYNC_ROW_UPDATE_THRESHOLD = int(os.environ.get('VOCABAI_ASYNC_ROW_UPDATE_THRESHOLD', 100))
+
 class LanguageTextField(models.TextField):
     pass
 
@@ -65,6 +77,11 @@ class TranslationTextField(models.TextField):
 
 
 class TransformationFieldType(FieldType):
+    # attributes which change the transformed values, updating any other attribute doesn't need a backfill
+    backfill_attribute_names = ['source_field_id']
+    # transformations which call the cloudlanguagetools services, local ones are cheap enough to run inline
+    remote_transformation = True
+
     def get_field_dependencies(self, field_instance: Field, field_lookup_cache: FieldCache):
         logger.debug(f'get_field_dependencies')
         if field_instance.source_field != None:
@@ -92,7 +109,28 @@ class TransformationFieldType(FieldType):
         before,
         to_field_kwargs
     ):
-        self.update_all_rows(to_field)        
+        if self.backfill_attributes_changed(from_field, to_field):
+            self.update_all_rows(to_field)
+        elif to_field_kwargs.get('fill_missing', False):
+            # only populate the rows which have no value yet
+            self.update_all_rows(to_field, fill_missing=True)
+        else:
+            logger.info(f'field {to_field.id} updated without changing the transformation, not populating rows')
+
+    def get_config_hash(self, field):
+        """fingerprint of the settings the transformed values depend on"""
+        config_values = [getattr(field, name) for name in self.backfill_attribute_names]
+        return fingerprints.get_config_hash(self.type, field.source_field.language, *config_values)
+
+    def run_backfill_task(self, field, task, *args, **kwargs):
+        # recorded in the job ledger, the task is dispatched once the field is committed
+        schedule_backfill(field, self.get_usage_user_id(field), task, args, kwargs)
+
+    def backfill_attributes_changed(self, from_field, to_field):
+        if not isinstance(from_field, self.model_class):
+            # converted from another field type
+            return True
+        return any(getattr(from_field, name) != getattr(to_field, name) for name in self.backfill_attribute_names)
 
     def get_transformed_value(self, field, source_value, usage_user_id):
         if source_value == None or len(source_value) == 0:
@@ -100,19 +138,45 @@ class TransformationFieldType(FieldType):
         transformed_value = self.transform_value(field, source_value, usage_user_id)
         return transformed_value
 
-    def get_usage_user_id(self, field):
-        """get the user_id that this usage will be associated with"""
-
-        # find the admin in the group
-        workspace = field.table.database.workspace
+    def transform_values(self, field, source_values, usage_user_id, quota_reservation=None):
+        """transform a list of non-empty values, field types backed by a batch api override this"""
+        return [self.transform_value(field, source_value, usage_user_id) for source_value in source_values]
+
+    def get_transformation_cost(self, field, source_value):
+        # local transformations are free
+        return 0
+
+    def transform_values_reserved(self, field, source_values, usage_user_id):
+        """transform_values, with the quota for all the values reserved in one step, rather than charged batch by batch"""
+        if not self.remote_transformation:
+            return self.transform_values(field, source_values, usage_user_id)
+        estimated_characters = sum(self.get_transformation_cost(field, source_value) for source_value in source_values)
+        quota_reservation = quotas.reserve_quota(usage_user_id, estimated_characters)
+        try:
+            return self.transform_values(field, source_values, usage_user_id, quota_reservation)
+        finally:
+            quota_reservation.release()
+
+    def transform_values_with_siblings(self, field, rows_by_value, source_hashes, usage_user_id):
+        """transform the source values of rows_by_value, in order. field types which can compute other fields in the
+        same service calls override this, and write those fields as well"""
+        return self.transform_values_reserved(field, list(rows_by_value.keys()), usage_user_id)
 
-        admin_users = WorkspaceUser.objects.filter(workspace_id=workspace.id, permissions=WORKSPACE_USER_PERMISSION_ADMIN)
-        for admin_user in admin_users:
-            logger.info(f'admin_user: {admin_user.user}')
-            return admin_user.user.id
-
-        logger.error(f'admin user not found in group {group} workspace.id: {workspace.id}')
-        return None
+    def get_usage_user_id(self, field):
+        """get the user_id that this usage will be associated with, the admin of the workspace"""
+        return quotas.get_workspace_usage_user_id(field.table.database.workspace_id)
+
+    def estimate_backfill(self, field, usage_user_id, cost_fn, fill_missing):
+        """approximate the cost of populating all rows, before the backfill starts. it gets attached to the field instance,
+        so that it's returned to the user in the field create / update response. the backfill task computes the exact
+        cost, outside of the request"""
+        estimated_characters = approximate_backfill_characters(field.table.id, f'field_{field.source_field.id}', f'field_{field.id}', cost_fn,
+                                                               fill_missing=fill_missing)
+        field.backfill_estimate = {
+            'characters': estimated_characters,
+            'available_characters': quotas.get_usage_record(usage_user_id).get_available_characters()
+        }
+        logger.info(f'backfill estimate for field {field.id}: {field.backfill_estimate}')
 
     def process_transformation(self, field, starting_row):
         source_internal_field_name = f'field_{field.source_field.id}'
@@ -128,15 +192,95 @@ class TransformationFieldType(FieldType):
             # we got a single TableModel, transform it into a list of one element
             row_list = [starting_row]
 
+        # skip the rows whose source value hasn't changed since they were last computed
+        config_hash = self.get_config_hash(field)
+        source_hashes = {}
+        for row in row_list:
+            source_value = getattr(row, source_internal_field_name)
+            if source_value != None and len(source_value) > 0:
+                source_hashes[row.id] = fingerprints.get_source_hash(source_value)
+        unchanged_row_ids = fingerprints.get_unchanged_row_ids(field.id, source_hashes, config_hash)
+        # a fingerprint doesn't vouch for a value which has since been cleared
+        unchanged_row_ids = {row.id for row in row_list if row.id in unchanged_row_ids and getattr(row, target_internal_field_name)}
+
+        # group rows by source value, so that each distinct value only gets transformed once
         rows_to_bulk_update = []
+        emptied_row_ids = []
+        rows_by_value = {}
         for row in row_list:
+            if row.id in unchanged_row_ids:
+                continue
             source_value = getattr(row, source_internal_field_name)
-            transformed_value = self.get_transformed_value(field, source_value, self.get_usage_user_id(field))
-            setattr(row, target_internal_field_name, transformed_value)
+            if source_value == None or len(source_value) == 0:
+                setattr(row, target_internal_field_name, '')
+                emptied_row_ids.append(row.id)
+            else:
+                rows_by_value.setdefault(source_value, []).append(row)
             rows_to_bulk_update.append(row)
 
-        model = field.table.get_model()
-        model.objects.bulk_update(rows_to_bulk_update, fields=[field.db_column])
+        pending_row_ids = []
+        compute_async = ASYNC_ROW_UPDATES or len(rows_by_value) > ASYNC_ROW_UPDATE_THRESHOLD
+        if len(rows_by_value) > 0 and compute_async and self.remote_transformation:
+            # the stale values shouldn't be shown next to the new source values, they're cleared until the task is done
+            for source_value, value_row_list in rows_by_value.items():
+                for row in value_row_list:
+                    setattr(row, target_internal_field_name, None)
+                    pending_row_ids.append(row.id)
+            # the job records which rows are pending. it's committed along with the row update, the task can only
+            # see the new source values from then on
+            pending_rows_job = backfill_jobs.create_pending_rows_job(field.id, run_clt_transformation_rows.name, [field.id, pending_row_ids],
+                                                                     self.get_usage_user_id(field))
+            transaction.on_commit(lambda: dispatch_backfill_job(pending_rows_job))
+        elif len(rows_by_value) > 0:
+            source_values = list(rows_by_value.keys())
+            transformed_values = self.transform_values_with_siblings(field, rows_by_value, source_hashes, self.get_usage_user_id(field))
+            for source_value, transformed_value in zip(source_values, transformed_values):
+                for row in rows_by_value[source_value]:
+                    setattr(row, target_internal_field_name, transformed_value)
+
+        if len(rows_to_bulk_update) > 0:
+            model = field.table.get_model()
+            model.objects.bulk_update(rows_to_bulk_update, fields=[field.db_column])
+            computed_source_hashes = {row_id: source_hash for row_id, source_hash in source_hashes.items() if row_id not in unchanged_row_ids}
+            for row_id in pending_row_ids:
+                del computed_source_hashes[row_id]
+            fingerprints.store_fingerprints(field.id, computed_source_hashes, config_hash)
+            fingerprints.clear_fingerprints(field.id, emptied_row_ids + pending_row_ids)
+
+    def process_pending_rows(self, field, table_model, row_list):
+        """compute the rows which process_transformation left to a pending rows job, and write the results.
+        returns the rows which were updated"""
+        source_internal_field_name = f'field_{field.source_field.id}'
+        target_internal_field_name = f'field_{field.id}'
+        config_hash = self.get_config_hash(field)
+
+        # rows which were computed in the meantime (a later edit, or a backfill) have the fingerprint of their current value
+        current_source_hashes = {row.id: fingerprints.get_source_hash(getattr(row, source_internal_field_name))
+                                 for row in row_list if getattr(row, source_internal_field_name)}
+        unchanged_row_ids = fingerprints.get_unchanged_row_ids(field.id, current_source_hashes, config_hash)
+        row_list = [row for row in row_list if row.id not in unchanged_row_ids or not getattr(row, target_internal_field_name)]
+        source_values = list(set(getattr(row, source_internal_field_name) for row in row_list) - {None, ''})
+        if len(source_values) == 0:
+            return []
+        transformed_values = self.transform_values_reserved(field, source_values, self.get_usage_user_id(field))
+        transformed_value_map = dict(zip(source_values, transformed_values))
+
+        updated_row_list = []
+        source_hashes = {}
+        with transaction.atomic():
+            # the source may have been edited again while we were waiting on the service. that edit has scheduled
+            # its own task, only write the rows whose source value is still the one we transformed
+            current_source_values = dict(table_model.objects.select_for_update().filter(id__in=[row.id for row in row_list]).values_list('id', source_internal_field_name))
+            for row in row_list:
+                source_value = current_source_values.get(row.id)
+                setattr(row, source_internal_field_name, source_value)
+                if source_value in transformed_value_map:
+                    setattr(row, target_internal_field_name, transformed_value_map[source_value])
+                    updated_row_list.append(row)
+                    source_hashes[row.id] = fingerprints.get_source_hash(source_value)
+            table_model.objects.bulk_update(updated_row_list, fields=[target_internal_field_name])
+            fingerprints.store_fingerprints(field.id, source_hashes, config_hash)
+        return updated_row_list
 
 
     def row_of_dependency_deleted(
@@ -181,6 +325,7 @@ class TransformationFieldType(FieldType):
 class TranslationFieldType(TransformationFieldType):
     type = "translation"
     model_class = TranslationField
+    backfill_attribute_names = ['source_field_id', 'target_language', 'service']
     allowed_fields = [
         'source_field_id',
         'target_language',
@@ -189,7 +334,9 @@ class TranslationFieldType(TransformationFieldType):
     serializer_field_names = [
         'source_field_id',
         'target_language',
-        'service'
+        'service',
+        'backfill_estimate',
+        'fill_missing'
     ]
     serializer_field_overrides = {
         "source_field_id": serializers.IntegerField(
@@ -207,7 +354,16 @@ class TranslationFieldType(TransformationFieldType):
             required=True,
             allow_null=False,
             allow_blank=False
-        )
+        ),
+        "backfill_estimate": serializers.DictField(
+            read_only=True,
+            help_text="Cost of populating all rows, only returned when the field is created or updated",
+        ),
+        "fill_missing": serializers.BooleanField(
+            required=False,
+            write_only=True,
+            help_text="When updating the field, only populate the rows which don't have a value yet",
+        ),
     }
 
     can_be_primary_field = False
@@ -243,6 +399,102 @@ class TranslationFieldType(TransformationFieldType):
         translated_text = clt_interface.get_translation(source_value, source_language, target_language, translation_service, usage_user_id)
         return translated_text
 
+    def transform_values(self, field, source_values, usage_user_id, quota_reservation=None):
+        return clt_interface.get_translation_batch(source_values, field.source_field.language, field.target_language, field.service, usage_user_id,
+                                                   quota_reservation)
+
+    def get_transformation_cost(self, field, source_value):
+        return clt_interface.get_translation_cost(source_value, field.service)
+
+    def get_sibling_fields(self, field):
+        """translations of the same source field with the same service, into other languages which the service supports"""
+        sibling_field_list = TranslationField.objects.filter(table_id=field.table_id, source_field_id=field.source_field_id,
+                                                             service=field.service, trashed=False).exclude(id=field.id)
+        source_language = field.source_field.language
+        return [sibling_field for sibling_field in sibling_field_list
+                if field.service in clt_interface.get_translation_services_source_target_language(source_language, sibling_field.target_language)]
+
+    def get_sibling_row_ids(self, field, sibling_field_list, model, row_ids, source_hashes):
+        """sibling field id -> the rows which that sibling needs. a sibling whose fingerprint matches and whose cell still
+        has a value is up to date. a sibling which fails here is left out, its own update computes it"""
+        column_names = [sibling_field.db_column for sibling_field in sibling_field_list]
+        sibling_values = {row['id']: row for row in model.objects.filter(id__in=row_ids).values('id', *column_names)}
+        sibling_row_ids = {}
+        for sibling_field in sibling_field_list:
+            try:
+                with transaction.atomic():
+                    unchanged_row_ids = fingerprints.get_unchanged_row_ids(sibling_field.id, {row_id: source_hashes[row_id] for row_id in row_ids},
+                                                                           self.get_config_hash(sibling_field))
+            except Exception:
+                logger.exception(f'could not check sibling field {sibling_field.id} of field {field.id}, leaving it to its own update')
+                continue
+            needed_row_ids = {row_id for row_id in row_ids
+                              if row_id not in unchanged_row_ids or not sibling_values.get(row_id, {}).get(sibling_field.db_column)}
+            if len(needed_row_ids) > 0:
+                sibling_row_ids[sibling_field.id] = needed_row_ids
+        return sibling_row_ids
+
+    def transform_values_with_siblings(self, field, rows_by_value, source_hashes, usage_user_id):
+        # translations of the same source field with the same service, into other languages, are done in the same
+        # calls. their columns are written here, when their own update comes, the fingerprints show they're up to date
+        sibling_field_list = self.get_sibling_fields(field)
+        if len(sibling_field_list) == 0:
+            return super().transform_values_with_siblings(field, rows_by_value, source_hashes, usage_user_id)
+
+        source_values = list(rows_by_value.keys())
+        source_value_by_row_id = {row.id: source_value for source_value, value_row_list in rows_by_value.items() for row in value_row_list}
+        model = field.table.get_model(field_ids=[sibling_field.id for sibling_field in sibling_field_list], add_dependencies=False)
+        sibling_row_ids = self.get_sibling_row_ids(field, sibling_field_list, model, list(source_value_by_row_id.keys()), source_hashes)
+        sibling_field_list = [sibling_field for sibling_field in sibling_field_list if sibling_field.id in sibling_row_ids]
+        if len(sibling_field_list) == 0:
+            return super().transform_values_with_siblings(field, rows_by_value, source_hashes, usage_user_id)
+
+        target_languages = list(dict.fromkeys([field.target_language] + [sibling_field.target_language for sibling_field in sibling_field_list]))
+        estimated_characters = sum(self.get_transformation_cost(field, source_value) for source_value in source_values) * len(target_languages)
+        quota_reservation = quotas.reserve_quota(usage_user_id, estimated_characters)
+        try:
+            translations = clt_interface.get_translation_batch_multi_target(source_values, field.source_field.language, target_languages,
+                                                                            field.service, usage_user_id, quota_reservation)
+        except Exception:
+            # whatever was translated is in the translation memory, the siblings are computed by their own update
+            logger.exception(f'could not translate field {field.id} along with its siblings, translating it on its own')
+            translations = None
+        finally:
+            quota_reservation.release()
+        if translations == None:
+            return super().transform_values_with_siblings(field, rows_by_value, source_hashes, usage_user_id)
+
+        # the rows which need the same sibling columns are written together, usually that's a single bulk update
+        translated_values = {sibling_field.id: dict(zip(source_values, translations[sibling_field.target_language])) for sibling_field in sibling_field_list}
+        column_row_ids = {}
+        for row_id in source_value_by_row_id.keys():
+            column_field_ids = tuple(sibling_field.id for sibling_field in sibling_field_list if row_id in sibling_row_ids[sibling_field.id])
+            if len(column_field_ids) > 0:
+                column_row_ids.setdefault(column_field_ids, []).append(row_id)
+        sibling_fields_by_id = {sibling_field.id: sibling_field for sibling_field in sibling_field_list}
+        try:
+            with transaction.atomic():
+                for column_field_ids, row_ids in column_row_ids.items():
+                    sibling_row_list = [model(id=row_id, **{sibling_fields_by_id[sibling_field_id].db_column: translated_values[sibling_field_id][source_value_by_row_id[row_id]]
+                                                            for sibling_field_id in column_field_ids})
+                                        for row_id in row_ids]
+                    model.objects.bulk_update(sibling_row_list, fields=[sibling_fields_by_id[sibling_field_id].db_column for sibling_field_id in column_field_ids])
+                for sibling_field in sibling_field_list:
+                    fingerprints.store_fingerprints(sibling_field.id, {row_id: source_hashes[row_id] for row_id in sibling_row_ids[sibling_field.id]},
+                                                    self.get_config_hash(sibling_field))
+        except Exception:
+            logger.exception(f'could not write the siblings of field {field.id}, leaving them to their own update')
+            return translations[field.target_language]
+
+        # the caller's rows are what gets returned to the user
+        for source_value, value_row_list in rows_by_value.items():
+            for row in value_row_list:
+                for sibling_field in sibling_field_list:
+                    if row.id in sibling_row_ids[sibling_field.id] and hasattr(row, sibling_field.db_column):
+                        setattr(row, sibling_field.db_column, translated_values[sibling_field.id][source_value])
+
+        return translations[field.target_language]
+
     def row_of_dependency_updated(
         self,
         field,
@@ -285,7 +537,7 @@ class TranslationFieldType(TransformationFieldType):
         )        
 
 
-    def update_all_rows(self, field):
+    def update_all_rows(self, field, fill_missing=False):
         logger.info(f'update_all_rows')
         source_field_language = field.source_field.language
         target_language = field.target_language
@@ -297,25 +549,35 @@ class TranslationFieldType(TransformationFieldType):
 
         logger.info(f'after_update table_id: {table_id} source_field_id: {source_field_id} target_field_id: {target_field_id}')
 
-        run_clt_translation_all_rows.delay(table_id, 
-                                           source_field_language, 
-                                           target_language,
-                                           translation_service,
-                                           source_field_id, 
-                                           target_field_id,
-                                           self.get_usage_user_id(field))
+        usage_user_id = self.get_usage_user_id(field)
+        self.estimate_backfill(field, usage_user_id, 
+            lambda text: clt_interface.get_translation_cost(text, translation_service), fill_missing)
+
+        self.run_backfill_task(field, run_clt_translation_all_rows,
+            table_id,
+            source_field_language,
+            target_language,
+            translation_service,
+            source_field_id,
+            target_field_id,
+            usage_user_id,
+            config_hash=self.get_config_hash(field),
+            fill_missing=fill_missing)
 
 
 class TransliterationFieldType(TransformationFieldType):
     type = "transliteration"
     model_class = TransliterationField
+    backfill_attribute_names = ['source_field_id', 'transliteration_id']
     allowed_fields = [
         'source_field_id',
         'transliteration_id'
     ]
     serializer_field_names = [
         'source_field_id',
-        'transliteration_id'
+        'transliteration_id',
+        'backfill_estimate',
+        'fill_missing'
     ]
     serializer_field_overrides = {
         "source_field_id": serializers.IntegerField(
@@ -329,6 +591,15 @@ class TransliterationFieldType(TransformationFieldType):
             allow_null=False,
             allow_blank=False
         ),
+        "backfill_estimate": serializers.DictField(
+            read_only=True,
+            help_text="Cost of populating all rows, only returned when the field is created or updated",
+        ),
+        "fill_missing": serializers.BooleanField(
+            required=False,
+            write_only=True,
+            help_text="When updating the field, only populate the rows which don't have a value yet",
+        ),
     }
 
     can_be_primary_field = False
@@ -359,6 +630,12 @@ class TransliterationFieldType(TransformationFieldType):
         transliterated_text = clt_interface.get_transliteration(source_value, transliteration_id, usage_user_id)
         return transliterated_text
 
+    def transform_values(self, field, source_values, usage_user_id, quota_reservation=None):
+        return clt_interface.get_transliteration_batch(source_values, field.transliteration_id, usage_user_id, quota_reservation)
+
+    def get_transformation_cost(self, field, source_value):
+        return clt_interface.get_transliteration_cost(source_value, field.transliteration_id)
+
     def row_of_dependency_updated(
         self,
         field,
@@ -401,7 +678,7 @@ class TransliterationFieldType(TransformationFieldType):
         )        
 
 
-    def update_all_rows(self, field):
+    def update_all_rows(self, field, fill_missing=False):
         logger.info(f'update_all_rows')
         transliteration_id = field.transliteration_id
         source_field_id = f'field_{field.source_field.id}'
@@ -409,25 +686,34 @@ class TransliterationFieldType(TransformationFieldType):
 
         table_id = field.table.id
 
+        usage_user_id = self.get_usage_user_id(field)
+        self.estimate_backfill(field, usage_user_id, 
+            lambda text: clt_interface.get_transliteration_cost(text, transliteration_id), fill_missing)
 
-        run_clt_transliteration_all_rows.delay(table_id, 
-                                                transliteration_id,
-                                                source_field_id, 
-                                                target_field_id,
-                                                self.get_usage_user_id(field))
+        self.run_backfill_task(field, run_clt_transliteration_all_rows,
+            table_id,
+            transliteration_id,
+            source_field_id,
+            target_field_id,
+            usage_user_id,
+            config_hash=self.get_config_hash(field),
+            fill_missing=fill_missing)
 
 
 
 class DictionaryLookupFieldType(TransformationFieldType):
     type = "dictionary_lookup"
     model_class = DictionaryLookupField
+    backfill_attribute_names = ['source_field_id', 'lookup_id']
     allowed_fields = [
         'source_field_id',
         'lookup_id'
     ]
     serializer_field_names = [
         'source_field_id',
-        'lookup_id'
+        'lookup_id',
+        'backfill_estimate',
+        'fill_missing'
     ]
     serializer_field_overrides = {
         "source_field_id": serializers.IntegerField(
@@ -441,6 +727,15 @@ class DictionaryLookupFieldType(TransformationFieldType):
             allow_null=False,
             allow_blank=False
         ),
+        "backfill_estimate": serializers.DictField(
+            read_only=True,
+            help_text="Cost of populating all rows, only returned when the field is created or updated",
+        ),
+        "fill_missing": serializers.BooleanField(
+            required=False,
+            write_only=True,
+            help_text="When updating the field, only populate the rows which don't have a value yet",
+        ),
     }
 
     can_be_primary_field = False
@@ -472,6 +767,12 @@ class DictionaryLookupFieldType(TransformationFieldType):
         lookup_result = clt_interface.get_dictionary_lookup(source_value, lookup_id, usage_user_id)
         return lookup_result
 
+    def transform_values(self, field, source_values, usage_user_id, quota_reservation=None):
+        return clt_interface.get_dictionary_lookup_batch(source_values, field.lookup_id, usage_user_id, quota_reservation)
+
+    def get_transformation_cost(self, field, source_value):
+        return clt_interface.get_dictionary_lookup_cost(source_value, field.lookup_id)
+
     def row_of_dependency_updated(
         self,
         field,
@@ -511,7 +812,7 @@ class DictionaryLookupFieldType(TransformationFieldType):
         )        
 
 
-    def update_all_rows(self, field):
+    def update_all_rows(self, field, fill_missing=False):
         logger.info(f'update_all_rows')
         lookup_id = field.lookup_id
         source_field_id = f'field_{field.source_field.id}'
@@ -519,15 +820,25 @@ class DictionaryLookupFieldType(TransformationFieldType):
 
         table_id = field.table.id
 
-        run_clt_lookup_all_rows.delay(table_id, 
-                                        lookup_id, 
-                                        source_field_id, 
-                                        target_field_id,
-                                        self.get_usage_user_id(field))
+        usage_user_id = self.get_usage_user_id(field)
+        self.estimate_backfill(field, usage_user_id, 
+            lambda text: clt_interface.get_dictionary_lookup_cost(text, lookup_id), fill_missing)
+
+        self.run_backfill_task(field, run_clt_lookup_all_rows,
+            table_id,
+            lookup_id,
+            source_field_id,
+            target_field_id,
+            usage_user_id,
+            config_hash=self.get_config_hash(field),
+            fill_missing=fill_missing)
 
 class ChineseRomanizationFieldType(TransformationFieldType):
     type = "chinese_romanization"
     model_class = ChineseRomanizationField
+    backfill_attribute_names = ['source_field_id', 'transformation', 'tone_numbers', 'spaces']
+    # pinyin / jyutping are computed locally
+    remote_transformation = False
     allowed_fields = [
         'source_field_id',
         'correction_table_id',
@@ -541,7 +852,8 @@ class ChineseRomanizationFieldType(TransformationFieldType):
         'correction_table_id',
         'transformation',
         'tone_numbers',
-        'spaces'        
+        'spaces',
+        'fill_missing'
     ]
     serializer_field_overrides = {
         "source_field_id": serializers.IntegerField(
@@ -568,7 +880,12 @@ class ChineseRomanizationFieldType(TransformationFieldType):
         "spaces": serializers.BooleanField(
             required=True,
             allow_null=False,
-        ),        
+        ),
+        "fill_missing": serializers.BooleanField(
+            required=False,
+            write_only=True,
+            help_text="When updating the field, only populate the rows which don't have a value yet",
+        ),
     }    
 
     can_be_primary_field = False
@@ -640,17 +957,20 @@ class ChineseRomanizationFieldType(TransformationFieldType):
         )        
 
 
-    def update_all_rows(self, field):
+    def update_all_rows(self, field, fill_missing=False):
         logger.info(f'update_all_rows')
         source_field_id = f'field_{field.source_field.id}'
         target_field_id = f'field_{field.id}'
 
         table_id = field.table.id
 
-        run_clt_chinese_romanization_all_rows.delay(table_id, 
-                                                    field.transformation,
-                                                    field.tone_numbers,
-                                                    field.spaces,
-                                                    source_field_id, 
-                                                    target_field_id,
-                                                    self.get_usage_user_id(field))
\ No newline at end of file
+        self.run_backfill_task(field, run_clt_chinese_romanization_all_rows,
+            table_id,
+            field.transformation,
+            field.tone_numbers,
+            field.spaces,
+            source_field_id,
+            target_field_id,
+            self.get_usage_user_id(field),
+            config_hash=self.get_config_hash(field),
+            fill_missing=fill_missing)
\ No newline at end of file
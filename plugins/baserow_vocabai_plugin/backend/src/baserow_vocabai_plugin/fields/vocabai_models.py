@@ -138,6 +138,160 @@ class VocabAiLanguageData(models.Model):
     # keep track of when this record was modified
     updated_time = models.DateTimeField(auto_now=True)
 
+# translation memory
+# ==================
+
+class VocabAiTranslationMemory(models.Model):
+    # sha256 of the normalized source text
+    text_hash = models.CharField(max_length=64)
+
+    # translation service and the service-specific language ids
+    service = models.CharField(max_length=255)
+    source_language_id = models.CharField(max_length=255)
+    target_language_id = models.CharField(max_length=255)
+
+    translated_text = models.TextField()
+
+    # used for TTL and size based eviction
+    created_time = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['text_hash', 'service', 'source_language_id', 'target_language_id'],
+                name='vocabai_translation_memory_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['created_time']),
+        ]
+
+# dictionary memory
+# =================
+
+class VocabAiDictionaryMemory(models.Model):
+    # sha256 of the normalized text
+    text_hash = models.CharField(max_length=64)
+
+    # dictionary service and the service-specific lookup key
+    service = models.CharField(max_length=255)
+    lookup_key = models.CharField(max_length=255)
+
+    # the flattened lookup result, null when the text isn't in the dictionary
+    result = models.TextField(null=True)
+
+    # used for TTL and size based eviction
+    created_time = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['text_hash', 'service', 'lookup_key'],
+                name='vocabai_dictionary_memory_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['created_time']),
+        ]
+
+# backfill jobs
+# =============
+
+BACKFILL_STATUS_SCHEDULED = 'scheduled'
+BACKFILL_STATUS_RUNNING = 'running'
+BACKFILL_STATUS_DEFERRED = 'deferred'
+BACKFILL_STATUS_FAILED = 'failed'
+BACKFILL_STATUS_CHOICES = (
+    (BACKFILL_STATUS_SCHEDULED, "Scheduled"),
+    (BACKFILL_STATUS_RUNNING, "Running"),
+    (BACKFILL_STATUS_DEFERRED, "Deferred"),
+    (BACKFILL_STATUS_FAILED, "Failed"),
+)
+
+class VocabAiBackfillJob(models.Model):
+    # backfill of a transformation field which is in progress, or was interrupted (quota exhausted).
+    # all rows after last_row_id are pending. the job is deleted once all rows are populated
+    field = models.ForeignKey(
+        Field,
+        on_delete=models.CASCADE,
+        help_text="The field being populated",
+        related_name='+'
+    )
+
+    status = models.CharField(
+        max_length=32,
+        default=BACKFILL_STATUS_RUNNING,
+        choices=BACKFILL_STATUS_CHOICES
+    )
+
+    # the celery task which populates the field, and the arguments it was started with
+    task_name = models.CharField(max_length=255)
+    task_args = models.JSONField(default=list)
+    task_kwargs = models.JSONField(default=dict)
+
+    # user whose quota is charged
+    usage_user_id = models.IntegerField()
+
+    # checkpoint: rows up to and including this id have been populated
+    last_row_id = models.IntegerField(default=0)
+
+    # set when the backfill is split in shards, the shard covers rows up to and including this id
+    end_row_id = models.IntegerField(null=True, blank=True)
+
+    # progress counters, as of the last checkpoint
+    rows = models.IntegerField(default=0)
+    calls = models.IntegerField(default=0)
+    calls_saved = models.IntegerField(default=0)
+
+    # set when the job is deferred, the estimated cost of the rows which are still pending
+    remaining_characters = models.IntegerField(null=True, blank=True)
+
+    # incremented each time the scheduler dispatches the job again (resumed, or restarted when stalled). a task
+    # only works on the job while it holds the current attempt, so that a task which is still queued can't run
+    # alongside its replacement
+    attempt = models.IntegerField(default=0)
+
+    # attempts which raised or lost their worker since the last checkpoint. past a limit, the job is marked
+    # failed rather than retried forever
+    failures = models.IntegerField(default=0)
+
+    # quota reserved by the current attempt, and not used as of the last checkpoint. given back when the attempt
+    # dies without releasing it
+    reserved_characters = models.IntegerField(default=0)
+
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_time']),
+        ]
+
+# cell fingerprints
+# =================
+
+class VocabAiCellFingerprint(models.Model):
+    # what a transformation field cell was last computed from, so that recomputing
+    # can skip the cells whose source value and field settings haven't changed
+    field = models.ForeignKey(
+        Field,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    row_id = models.IntegerField()
+
+    # 64 bit hashes of the source value, and of the transformation settings
+    source_hash = models.BigIntegerField()
+    config_hash = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['field', 'row_id'],
+                name='vocabai_cell_fingerprint_key'
+            ),
+        ]
+
 # user record
 # ===========
 
@@ -187,6 +341,12 @@ class VocabAiUsage(models.Model):
     updated_time = models.DateTimeField(auto_now=True)
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'period_time'],
+                name='vocabai_usage_user_period'
+            ),
+        ]
         indexes = [
             models.Index(fields=['user', 'period', 'period_time']),
             models.Index(fields=['updated_time']),
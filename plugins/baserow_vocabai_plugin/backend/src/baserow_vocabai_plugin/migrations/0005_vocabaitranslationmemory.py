@@ -0,0 +1,33 @@
+# Generated by Django 3.2.18 on 2026-10-17 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0004_chineseromanizationfield'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabAiTranslationMemory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('service', models.CharField(max_length=255)),
+                ('source_language_id', models.CharField(max_length=255)),
+                ('target_language_id', models.CharField(max_length=255)),
+                ('translated_text', models.TextField()),
+                ('created_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='vocabaitranslationmemory',
+            index=models.Index(fields=['created_time'], name='baserow_voc_created_f07e1c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vocabaitranslationmemory',
+            constraint=models.UniqueConstraint(fields=('text_hash', 'service', 'source_language_id', 'target_language_id'), name='vocabai_translation_memory_key'),
+        ),
+    ]
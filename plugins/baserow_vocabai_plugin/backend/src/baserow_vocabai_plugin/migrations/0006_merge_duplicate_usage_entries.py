@@ -0,0 +1,31 @@
+# Generated by Django 3.2.18 on 2026-10-17 21:05
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_usage_entries(apps, schema_editor):
+    # concurrent workers could create several entries for the same user and period,
+    # fold them into one before adding the unique constraint
+    VocabAiUsage = apps.get_model('baserow_vocabai_plugin', 'VocabAiUsage')
+    duplicates = VocabAiUsage.objects.values('user_id', 'period', 'period_time').annotate(
+        entry_count=Count('id'), total_characters=Sum('characters')).filter(entry_count__gt=1)
+    for duplicate in duplicates:
+        entries = list(VocabAiUsage.objects.filter(
+            user_id=duplicate['user_id'], period=duplicate['period'], period_time=duplicate['period_time']).order_by('id'))
+        entries[0].characters = duplicate['total_characters']
+        entries[0].save()
+        VocabAiUsage.objects.filter(id__in=[entry.id for entry in entries[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('baserow_vocabai_plugin', '0005_vocabaitranslationmemory'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_usage_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.18 on 2026-10-17 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('baserow_vocabai_plugin', '0006_merge_duplicate_usage_entries'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='vocabaiusage',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'period_time'), name='vocabai_usage_user_period'),
+        ),
+    ]
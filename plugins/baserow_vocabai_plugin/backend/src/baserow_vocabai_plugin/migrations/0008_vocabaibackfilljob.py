@@ -0,0 +1,34 @@
+# Generated by Django 3.2.18 on 2026-10-17 21:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0084_duplicatetablejob'),
+        ('baserow_vocabai_plugin', '0007_vocabaiusage_unique_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabAiBackfillJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('deferred', 'Deferred')], default='deferred', max_length=32)),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_args', models.JSONField(default=list)),
+                ('task_kwargs', models.JSONField(default=dict)),
+                ('usage_user_id', models.IntegerField()),
+                ('last_row_id', models.IntegerField(default=0)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+                ('field', models.ForeignKey(help_text='The field being populated', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='database.field')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='vocabaibackfilljob',
+            index=models.Index(fields=['status', 'updated_time'], name='baserow_voc_status_eae850_idx'),
+        ),
+    ]
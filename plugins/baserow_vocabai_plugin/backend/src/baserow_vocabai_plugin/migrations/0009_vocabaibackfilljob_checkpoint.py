@@ -0,0 +1,33 @@
+# Generated by Django 3.2.18 on 2026-10-17 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0008_vocabaibackfilljob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='calls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='calls_saved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='rows',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='vocabaibackfilljob',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('deferred', 'Deferred')], default='running', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0009_vocabaibackfilljob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='end_row_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.18 on 2026-10-17 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0084_duplicatetablejob'),
+        ('baserow_vocabai_plugin', '0010_vocabaibackfilljob_end_row_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabAiCellFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_id', models.IntegerField()),
+                ('source_hash', models.BigIntegerField()),
+                ('config_hash', models.BigIntegerField()),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='database.field')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vocabaicellfingerprint',
+            constraint=models.UniqueConstraint(fields=('field', 'row_id'), name='vocabai_cell_fingerprint_key'),
+        ),
+    ]
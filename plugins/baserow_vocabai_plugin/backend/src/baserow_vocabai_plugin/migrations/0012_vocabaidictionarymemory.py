@@ -0,0 +1,32 @@
+# Generated by Django 3.2.18 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0011_vocabaicellfingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabAiDictionaryMemory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('service', models.CharField(max_length=255)),
+                ('lookup_key', models.CharField(max_length=255)),
+                ('result', models.TextField(null=True)),
+                ('created_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='vocabaidictionarymemory',
+            index=models.Index(fields=['created_time'], name='baserow_voc_created_8912e7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vocabaidictionarymemory',
+            constraint=models.UniqueConstraint(fields=('text_hash', 'service', 'lookup_key'), name='vocabai_dictionary_memory_key'),
+        ),
+    ]
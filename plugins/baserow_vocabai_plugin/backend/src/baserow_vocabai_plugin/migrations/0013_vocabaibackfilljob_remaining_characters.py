@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0012_vocabaidictionarymemory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='remaining_characters',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-17 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0013_vocabaibackfilljob_remaining_characters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='attempt',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.18 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0014_vocabaibackfilljob_attempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vocabaibackfilljob',
+            name='reserved_characters',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='vocabaibackfilljob',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('deferred', 'Deferred'), ('failed', 'Failed')], default='running', max_length=32),
+        ),
+    ]
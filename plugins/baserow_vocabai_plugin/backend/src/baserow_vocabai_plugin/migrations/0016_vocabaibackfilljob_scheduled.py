@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('baserow_vocabai_plugin', '0015_vocabaibackfilljob_failures'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vocabaibackfilljob',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('running', 'Running'), ('deferred', 'Deferred'), ('failed', 'Failed')], default='running', max_length=32),
+        ),
+    ]
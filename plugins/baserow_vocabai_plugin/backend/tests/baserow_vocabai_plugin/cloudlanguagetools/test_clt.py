@@ -5,11 +5,28 @@ import importlib
 import pprint
 import json
 import logging
+import datetime
+import gzip
+import time
+import threading
 from django.shortcuts import reverse
-from rest_framework.status import HTTP_200_OK
-
-from baserow_vocabai_plugin.cloudlanguagetools import clt_interface, quotas
+from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.status import HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_304_NOT_MODIFIED
+
+from baserow.contrib.database.table.signals import table_updated
+from baserow.contrib.database.rows.signals import rows_updated
+from baserow.core.models import WorkspaceUser
+from baserow.core.signals import workspace_user_deleted
+
+from baserow_vocabai_plugin.cloudlanguagetools import clt_interface, quotas, translation_memory, dictionary_memory, tasks, backfill_jobs, singleflight
+from baserow_vocabai_plugin.fields import vocabai_fieldtypes
+from baserow_vocabai_plugin.fields.vocabai_fieldtypes import TranslationFieldType
+from baserow_vocabai_plugin.fields.vocabai_models import VocabAiTranslationMemory, VocabAiDictionaryMemory, VocabAiBackfillJob, VocabAiCellFingerprint, TranslationField, BACKFILL_STATUS_SCHEDULED, BACKFILL_STATUS_DEFERRED, BACKFILL_STATUS_FAILED
 import cloudlanguagetools.languages
+import cloudlanguagetools.constants
 
 logger = logging.getLogger(__name__)
 
@@ -44,10 +61,150 @@ def test_language_data(api_client, data_fixture):
     assert response.status_code == HTTP_200_OK
 
     # verify some things
-    language_list = response.data
+    language_list = response.json()
     assert 'fr' in language_list
     assert language_list['fr'] == 'French'
 
+    # revalidating with the ETag doesn't download the data again
+    etag = response['ETag']
+    response = api_client.get(
+        reverse("api:baserow_vocabai_plugin:language-list"),
+        HTTP_IF_NONE_MATCH=etag,
+    )
+    assert response.status_code == HTTP_304_NOT_MODIFIED
+
+    # the response is compressed for clients which support it
+    response = api_client.get(
+        reverse("api:baserow_vocabai_plugin:language-list"),
+        HTTP_ACCEPT_ENCODING='gzip, deflate, br',
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.content)) == language_list
+    # shared caches keep the plain and the gzipped body apart
+    assert 'Accept-Encoding' in response['Vary']
+
+    # a q-value of 0 refuses gzip
+    for accept_encoding in ['gzip;q=0, deflate', 'gzip; q=0.0', '*;q=0', 'identity']:
+        response = api_client.get(
+            reverse("api:baserow_vocabai_plugin:language-list"),
+            HTTP_ACCEPT_ENCODING=accept_encoding,
+        )
+        assert response.status_code == HTTP_200_OK
+        assert 'Content-Encoding' not in response
+        assert response.json() == language_list
+        assert 'Accept-Encoding' in response['Vary']
+
+    for accept_encoding in ['gzip;q=0.5, identity;q=1', '*', 'deflate, GZIP;Q=1']:
+        response = api_client.get(
+            reverse("api:baserow_vocabai_plugin:language-list"),
+            HTTP_ACCEPT_ENCODING=accept_encoding,
+        )
+        assert response['Content-Encoding'] == 'gzip'
+
+    # a language data refresh changes the ETag
+    clt_interface.update_language_data()
+    response = api_client.get(
+        reverse("api:baserow_vocabai_plugin:language-list"),
+        HTTP_IF_NONE_MATCH=etag,
+    )
+    assert response.status_code == HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_language_data_version(data_fixture, django_assert_num_queries):
+    use_clt_test_services()
+    clt_interface.update_language_data()
+
+    language_data = clt_interface.load_language_data()
+    # served from the process-local copy
+    with django_assert_num_queries(0):
+        assert clt_interface.load_language_data() is language_data
+
+    # another process refreshes the language data, the new version is picked up here
+    clt_interface.update_language_data()
+    refreshed_language_data = clt_interface.load_language_data()
+    assert refreshed_language_data is not language_data
+    assert refreshed_language_data['version'] == cache.get(clt_interface.LANGUAGE_DATA_VERSION_CACHE_KEY)
+    assert refreshed_language_data['version'] != language_data['version']
+
+    # a stale version in the shared cache causes one reload, which fixes it
+    cache.set(clt_interface.LANGUAGE_DATA_VERSION_CACHE_KEY, language_data['version'], timeout=None)
+    reloaded_language_data = clt_interface.load_language_data()
+    assert reloaded_language_data['version'] == refreshed_language_data['version']
+    assert cache.get(clt_interface.LANGUAGE_DATA_VERSION_CACHE_KEY) == refreshed_language_data['version']
+    with django_assert_num_queries(0):
+        assert clt_interface.load_language_data() is reloaded_language_data
+
+    # the cache was flushed, the version is read from the record, without reloading it
+    cache.delete(clt_interface.LANGUAGE_DATA_VERSION_CACHE_KEY)
+    with django_assert_num_queries(1):
+        assert clt_interface.load_language_data() is reloaded_language_data
+    assert cache.get(clt_interface.LANGUAGE_DATA_VERSION_CACHE_KEY) == refreshed_language_data['version']
+
+
+@pytest.mark.django_db
+def test_language_data_index(data_fixture):
+    use_clt_test_services()
+    clt_interface.update_language_data()
+
+    index = clt_interface.get_language_data_index()
+
+    # the index agrees with a scan of the option lists
+    translation_options = clt_interface.get_translation_options()
+    for option in translation_options:
+        assert index.translation_language_ids[(option['language_code'], option['service'])] == option['language_id']
+    source_services = set(x['service'] for x in translation_options if x['language_code'] == 'fr')
+    target_services = set(x['service'] for x in translation_options if x['language_code'] == 'en')
+    assert clt_interface.get_translation_services_source_target_language('fr', 'en') == sorted(source_services & target_services)
+    assert clt_interface.get_translation_services_source_target_language('fr', 'not_a_language') == []
+
+    for option in clt_interface.get_transliteration_options():
+        assert index.transliteration_options[option['transliteration_id']] == option
+        assert option in index.transliteration_options_by_language[option['language_code']]
+    for option in clt_interface.get_dictionary_lookup_options():
+        assert index.dictionary_lookup_options[option['lookup_id']] == option
+        assert option in index.dictionary_lookup_options_by_language[option['language_code']]
+
+    # built once per version
+    assert clt_interface.get_language_data_index() is index
+    clt_interface.update_language_data()
+    assert clt_interface.get_language_data_index() is not index
+
+
+@pytest.mark.django_db
+def test_language_options_filtering(api_client, data_fixture):
+    use_clt_test_services()
+
+    # update language data first
+    clt_interface.update_language_data()
+
+    all_options = clt_interface.get_transliteration_options()
+    option = all_options[0]
+    language = option['language_code']
+    expected_options = [x for x in all_options if x['language_code'] == language]
+
+    # options for a single language
+    url = reverse("api:baserow_vocabai_plugin:language-transliteration-options", kwargs={'language': language})
+    response = api_client.get(url)
+    assert response.status_code == HTTP_200_OK
+    assert response.json() == {'count': len(expected_options), 'results': expected_options}
+
+    # pagination
+    response = api_client.get(url, {'offset': 0, 'limit': 1})
+    assert response.json() == {'count': len(expected_options), 'results': expected_options[0:1]}
+
+    # filter by service and name prefix
+    response = api_client.get(url, {'service': option['service'], 'search': option['transliteration_shortname'][0:2].upper()})
+    assert option in response.json()['results']
+    assert all(x['service'] == option['service'] for x in response.json()['results'])
+
+    # unknown language
+    url = reverse("api:baserow_vocabai_plugin:language-dictionary-lookup-options", kwargs={'language': 'not_a_language'})
+    response = api_client.get(url)
+    assert response.json() == {'count': 0, 'results': []}
+
 
 @pytest.mark.django_db
 def test_quotas(api_client, data_fixture):
@@ -85,6 +242,276 @@ def test_quotas(api_client, data_fixture):
         translation_result_str = clt_interface.get_translation('yoyo3', 'fr', 'en', 'TestServiceB', user.id)
 
 
+@pytest.mark.django_db
+def test_quota_reserve(data_fixture):
+    user = data_fixture.create_user()
+
+    usage_record = quotas.get_usage_record(user.id)
+    usage_record.reserve(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 10)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 10
+    assert quotas.get_usage_record(user.id).monthly_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 10
+
+    # a reservation which doesn't fit isn't charged at all, on either period
+    with pytest.raises(quotas.QuotaOverUsage):
+        quotas.get_usage_record(user.id).reserve(11)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 10
+    assert quotas.get_usage_record(user.id).monthly_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 10
+
+    # a stale usage record can't overspend either
+    usage_record.reserve(10)
+    with pytest.raises(quotas.QuotaOverUsage):
+        usage_record.reserve(1)
+
+    # unused characters can be given back
+    quotas.get_usage_record(user.id).release(4)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 4
+
+
+@pytest.mark.django_db
+def test_quota_reservation(data_fixture):
+    user = data_fixture.create_user()
+
+    # the whole estimate fits, it gets reserved in one step
+    quota_reservation = quotas.reserve_quota(user.id, 1000)
+    assert quota_reservation.reserved_characters == 1000
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 1000
+
+    # charges and refunds are local to the reservation
+    quota_reservation.charge(300)
+    quota_reservation.refund(100)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 1000
+
+    # unused characters are given back at the end
+    quota_reservation.release()
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 200
+
+    # an estimate larger than what's left gets a partial reservation
+    quota_reservation = quotas.reserve_quota(user.id, quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
+    assert quota_reservation.reserved_characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 200
+    quota_reservation.charge(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 200)
+    with pytest.raises(quotas.QuotaOverUsage):
+        quota_reservation.charge(1)
+    quota_reservation.release()
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS
+
+
+def test_iterate_results_concurrently():
+    # calls which finish out of order are yielded in input order
+    finished_list = []
+    delays = {'a': 0.3, 'b': 0, 'c': 0.15}
+    def call(value):
+        time.sleep(delays[value])
+        finished_list.append(value)
+        return value.upper()
+    assert list(clt_interface.iterate_results_concurrently(call, ['a', 'b', 'c'], 3)) == [('a', 'A'), ('b', 'B'), ('c', 'C')]
+    assert finished_list == ['b', 'c', 'a']
+
+    # the first error cancels the calls which haven't started, the ones which did complete are yielded
+    # before the error is raised
+    called_list = []
+    def call_failing(value):
+        called_list.append(value)
+        if value == 'fail':
+            time.sleep(0.05)
+            raise Exception('service error')
+        if value != 'ok':
+            time.sleep(0.1)
+        return value
+    values = ['ok', 'fail'] + [f'value_{i}' for i in range(20)]
+    yielded_list = []
+    with pytest.raises(Exception, match='service error'):
+        for value, result in clt_interface.iterate_results_concurrently(call_failing, values, 2):
+            yielded_list.append(result)
+    assert len(called_list) < len(values)
+    assert yielded_list == [value for value in values if value in called_list and value != 'fail']
+    assert yielded_list[0] == 'ok'
+
+
+@pytest.mark.django_db
+def test_iterate_results_in_transaction():
+    # worker threads wouldn't see uncommitted data, the calls are made on the calling thread
+    with transaction.atomic():
+        result_list = [result for value, result in clt_interface.iterate_results_concurrently(lambda value: threading.get_ident(), [1, 2, 3], 4)]
+    assert result_list == [threading.get_ident()] * 3
+
+
+@pytest.mark.django_db
+def test_run_batch_refunds(data_fixture):
+    use_clt_test_services()
+    user = data_fixture.create_user()
+
+    def call(text):
+        if text == 'fail':
+            raise Exception('service error')
+        if text == 'missing':
+            # not found
+            return None
+        return text.upper()
+    request_type = cloudlanguagetools.constants.RequestType.dictionary
+
+    # the whole batch is charged up front, the texts which weren't found are refunded
+    results = {}
+    clt_interface.run_batch(['found', 'missing'], 'TestServiceB', request_type, call, user.id, results)
+    assert results == {'found': 'FOUND', 'missing': None}
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('found')
+
+    # failed calls, and the calls which didn't run because of the failure, are refunded
+    results = {}
+    with pytest.raises(Exception, match='service error'):
+        clt_interface.run_batch(['fail', 'other'], 'TestServiceB', request_type, call, user.id, results)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('found')
+
+    # the same goes for calls charged to a reservation
+    quota_reservation = quotas.reserve_quota(user.id, 100)
+    results = {}
+    clt_interface.run_batch(['found', 'missing'], 'TestServiceB', request_type, call, user.id, results, quota_reservation)
+    assert quota_reservation.used_characters == len('found')
+    with pytest.raises(Exception, match='service error'):
+        clt_interface.run_batch(['fail'], 'TestServiceB', request_type, call, user.id, results, quota_reservation)
+    assert quota_reservation.used_characters == len('found')
+    quota_reservation.release()
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 2 * len('found')
+
+
+@pytest.mark.django_db
+def test_workspace_usage_user(data_fixture, django_assert_num_queries):
+    user = data_fixture.create_user()
+    workspace = data_fixture.create_workspace(user=user)
+
+    assert quotas.get_workspace_usage_user_id(workspace.id) == user.id
+    # cached after the first lookup
+    with django_assert_num_queries(0):
+        assert quotas.get_workspace_usage_user_id(workspace.id) == user.id
+
+    # another admin takes over the workspace
+    other_user = data_fixture.create_user()
+    data_fixture.create_user_workspace(workspace=workspace, user=other_user, permissions='ADMIN')
+    workspace_user = WorkspaceUser.objects.get(workspace=workspace, user=user)
+    workspace_user_id = workspace_user.id
+    workspace_user.delete()
+    workspace_user_deleted.send(None, workspace_user_id=workspace_user_id, workspace_user=workspace_user, user=user)
+
+    assert quotas.get_workspace_usage_user_id(workspace.id) == other_user.id
+
+    # the user is deleted along with its memberships, the cached admin goes with it
+    other_user_id = other_user.id
+    data_fixture.create_user_workspace(workspace=workspace, user=user, permissions='ADMIN')
+    other_user.delete()
+    assert quotas.get_workspace_usage_user_id(workspace.id) == user.id
+    with pytest.raises(Exception, match='not found'):
+        quotas.get_usage_record(other_user_id)
+
+
+@pytest.mark.django_db
+def test_singleflight(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    source_language_key, target_language_key = clt_interface.get_translation_language_keys('fr', 'en', 'TestServiceB')
+    call_key = singleflight.get_call_key('translation', 'TestServiceB', (source_language_key, target_language_key), 'souris')
+    lease_cache_key = singleflight.get_lease_cache_key(call_key)
+    result_cache_key = singleflight.get_result_cache_key(call_key)
+
+    # another worker is making the same call, we get its result without being charged
+    cache.add(lease_cache_key, True)
+    cache.set(result_cache_key, {'result': 'published translation'})
+    assert clt_interface.get_translation('souris', 'fr', 'en', 'TestServiceB', user.id) == 'published translation'
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 0
+
+    cache.delete(lease_cache_key)
+
+    # another worker never publishes its result, we make the call after waiting
+    monkeypatch.setattr(singleflight, 'SINGLEFLIGHT_WAIT_TIMEOUT', 0)
+    call_key = singleflight.get_call_key('translation', 'TestServiceB', (source_language_key, target_language_key), 'lapin')
+    lease_cache_key = singleflight.get_lease_cache_key(call_key)
+    cache.add(lease_cache_key, True)
+    result = clt_interface.get_translation_batch(['lapin', 'rat'], 'fr', 'en', 'TestServiceB', user.id)
+    assert [json.loads(text)['text'] for text in result] == ['lapin', 'rat']
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('lapin') + len('rat')
+    cache.delete(lease_cache_key)
+
+    # our own calls release their lease, and publish their result
+    call_key = singleflight.get_call_key('translation', 'TestServiceB', (source_language_key, target_language_key), 'chat')
+    result = clt_interface.get_translation('chat', 'fr', 'en', 'TestServiceB', user.id)
+    assert cache.get(singleflight.get_lease_cache_key(call_key)) == None
+    assert cache.get(singleflight.get_result_cache_key(call_key)) == {'result': result}
+
+
+@pytest.mark.django_db
+def test_translation_memory(api_client, data_fixture):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+
+    # update language data first
+    clt_interface.update_language_data()
+
+    # first translation on a premium service gets charged
+    translation_result_str = clt_interface.get_translation('yoyo', 'fr', 'en', 'TestServiceB', user.id)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 4
+
+    # the same text, with different whitespace, comes out of the translation memory for free
+    memory_result_str = clt_interface.get_translation(' yoyo  ', 'fr', 'en', 'TestServiceB', user.id)
+    assert memory_result_str == translation_result_str
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 4
+
+    # a different language pair is a different entry
+    clt_interface.get_translation('yoyo', 'en', 'fr', 'TestServiceB', user.id)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 8
+
+    # expired entries are evicted
+    VocabAiTranslationMemory.objects.update(created_time=timezone.now() - datetime.timedelta(days=translation_memory.TRANSLATION_MEMORY_TTL_DAYS + 1))
+    translation_memory.evict_translation_memory()
+    assert VocabAiTranslationMemory.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_dictionary_memory(api_client, data_fixture):
+    dictionary_memory.store_results({'chat': 'cat', 'xyzw': None}, 'TestServiceA', 'fr_en')
+
+    # words which weren't found are remembered too
+    assert dictionary_memory.lookup_results([' chat ', 'xyzw', 'chien'], 'TestServiceA', 'fr_en') == {' chat ': 'cat', 'xyzw': None}
+    assert dictionary_memory.lookup_results(['chat'], 'TestServiceA', 'de_en') == {}
+
+    # but not for as long as the words which were found
+    VocabAiDictionaryMemory.objects.update(created_time=timezone.now() - datetime.timedelta(days=dictionary_memory.DICTIONARY_MEMORY_NOT_FOUND_TTL_DAYS + 1))
+    assert dictionary_memory.lookup_results(['chat', 'xyzw'], 'TestServiceA', 'fr_en') == {'chat': 'cat'}
+    dictionary_memory.evict_dictionary_memory()
+    assert VocabAiDictionaryMemory.objects.count() == 1
+
+    # a new lookup replaces the entry
+    dictionary_memory.store_results({'xyzw': 'a word'}, 'TestServiceA', 'fr_en')
+    assert dictionary_memory.lookup_results(['xyzw'], 'TestServiceA', 'fr_en') == {'xyzw': 'a word'}
+
+    # expired entries are evicted
+    VocabAiDictionaryMemory.objects.update(created_time=timezone.now() - datetime.timedelta(days=dictionary_memory.DICTIONARY_MEMORY_TTL_DAYS + 1))
+    dictionary_memory.evict_dictionary_memory()
+    assert VocabAiDictionaryMemory.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_translation_batch(api_client, data_fixture):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+
+    # update language data first
+    clt_interface.update_language_data()
+
+    # results come back in input order, duplicates are only charged once
+    result_list = clt_interface.get_translation_batch(['chat', 'chien', 'chat'], 'fr', 'en', 'TestServiceB', user.id)
+    assert [json.loads(result)['text'] for result in result_list] == ['chat', 'chien', 'chat']
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('chat') + len('chien')
+
+    # the whole batch is refused when it doesn't fit in the quota
+    quotas.get_usage_record(user.id).update_usage(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 12)
+    with pytest.raises(quotas.QuotaOverUsage):
+        clt_interface.get_translation_batch(['oiseau', 'poisson'], 'fr', 'en', 'TestServiceB', user.id)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - 3
+
+
 @pytest.mark.django_db(transaction=True)
 def test_add_language_field(api_client, data_fixture):
     use_clt_test_services()
@@ -99,7 +526,7 @@ def test_add_language_field(api_client, data_fixture):
 
     response = api_client.get(reverse('api:baserow_vocabai_plugin:translation-options'),HTTP_AUTHORIZATION=f"JWT {token}",)
     assert response.status_code == HTTP_200_OK
-    pprint.pprint(response.data)    
+    pprint.pprint(response.json())    
 
     # create database
     # ===============
@@ -162,6 +589,8 @@ def test_add_language_field(api_client, data_fixture):
     english_trans_field_id = response_json['id']
     # pprint.pprint(response_json)
     assert response.status_code == HTTP_200_OK    
+    # the table is empty, nothing to backfill
+    assert response_json['backfill_estimate']['characters'] == 0
 
 
     # enter some data in the french field
@@ -186,6 +615,1140 @@ def test_add_language_field(api_client, data_fixture):
 
 
 
+@pytest.mark.django_db
+def test_iterate_row_id_buckets(data_fixture, monkeypatch):
+    table = data_fixture.create_database_table()
+    model = table.get_model()
+    row_id_list = [model.objects.create().id for i in range(7)]
+    # gaps in the row ids
+    model.objects.filter(id__in=[row_id_list[2], row_id_list[5]]).delete()
+    r0, r1, r2, r3, r4, r5, r6 = row_id_list
+
+    monkeypatch.setattr(tasks, 'TASK_ITERATION_SIZE_PLAN', [[1, 1], [1, 2]])
+    # past the end of the plan, the last bucket size is reused
+    assert list(tasks.iterate_row_id_buckets(model)) == [[r0], [r1, r3], [r4, r6]]
+
+    # continuing from a checkpoint, up to the end of a shard
+    assert list(tasks.iterate_row_id_buckets(model, start_row_id=r1, progressive=False, end_row_id=r4)) == [[r3, r4]]
+    assert list(tasks.iterate_row_id_buckets(model, start_row_id=r6)) == []
+
+
+@pytest.mark.django_db
+def test_transform_rows(data_fixture):
+    table = data_fixture.create_database_table()
+    source_field = data_fixture.create_text_field(table=table, name='source')
+    target_field = data_fixture.create_text_field(table=table, name='target')
+    notes_field = data_fixture.create_text_field(table=table, name='notes')
+    model = table.get_model()
+    row_id_list = [model.objects.create(**{f'field_{source_field.id}': text}).id for text in ['a', 'b', 'a']]
+
+    row_list = list(model.objects.order_by('id'))
+    # edited while the bucket is being computed
+    model.objects.filter(id=row_id_list[0]).update(**{f'field_{notes_field.id}': 'edited'})
+
+    stats = tasks.BackfillStats()
+    with CaptureQueriesContext(connection) as captured_queries:
+        tasks.transform_rows(model, row_list, f'field_{source_field.id}', f'field_{target_field.id}', lambda texts: [text.upper() for text in texts], stats)
+
+    # a single bulk update, which only writes the target column
+    update_sql_list = [query['sql'] for query in captured_queries.captured_queries if query['sql'].startswith('UPDATE')]
+    assert len(update_sql_list) == 1
+    assert f'"field_{target_field.id}"' in update_sql_list[0]
+    assert f'"field_{notes_field.id}"' not in update_sql_list[0]
+    assert f'"field_{source_field.id}" =' not in update_sql_list[0]
+
+    row_list = list(model.objects.order_by('id'))
+    assert [getattr(row, f'field_{target_field.id}') for row in row_list] == ['A', 'B', 'A']
+    assert getattr(row_list[0], f'field_{notes_field.id}') == 'edited'
+    assert (stats.rows, stats.calls, stats.calls_saved) == (3, 2, 1)
+
+
+@pytest.mark.django_db
+def test_approximate_backfill_characters(data_fixture, django_assert_max_num_queries, monkeypatch):
+    table = data_fixture.create_database_table()
+    source_field = data_fixture.create_text_field(table=table, name='source')
+    target_field = data_fixture.create_text_field(table=table, name='target')
+    model = table.get_model()
+    for text in ['aa', 'bb', 'aa', 'cccc', '', None]:
+        model.objects.create(**{f'field_{source_field.id}': text})
+    source_field_id, target_field_id = f'field_{source_field.id}', f'field_{target_field.id}'
+    cost_fn = lambda text: 2 * len(text)
+
+    exact_characters = tasks.estimate_backfill_characters(table.id, source_field_id, target_field_id, cost_fn)
+    assert exact_characters == 16
+    # small tables are priced exactly
+    assert tasks.approximate_backfill_characters(table.id, source_field_id, target_field_id, cost_fn) == exact_characters
+
+    # past the sample size, the estimate takes a bounded number of queries regardless of the row count
+    monkeypatch.setattr(tasks, 'BACKFILL_ESTIMATE_SAMPLE_SIZE', 2)
+    with django_assert_max_num_queries(10):
+        assert tasks.approximate_backfill_characters(table.id, source_field_id, target_field_id, cost_fn) == exact_characters
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_dedup(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    french_words = ['Bonjour', 'Merci', 'Bonjour', 'Bonjour', 'Merci']
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": word} for word in french_words]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # a single bucket, so that the duplicates aren't served by the translation memory
+    monkeypatch.setattr(tasks, 'TASK_ITERATION_SIZE_PLAN', [[1, 100]])
+    translated_text_list = []
+    get_translation = clt_interface.manager.get_translation
+    def record_translation(text, *args, **kwargs):
+        translated_text_list.append(text)
+        return get_translation(text, *args, **kwargs)
+    monkeypatch.setattr(clt_interface.manager, 'get_translation', record_translation)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    # one service call for each distinct value, the result goes to every row sharing it
+    assert sorted(translated_text_list) == ['Bonjour', 'Merci']
+    row_list = table.get_model().objects.order_by('id')
+    assert [json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] for row in row_list] == french_words
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_notifications(api_client, data_fixture):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "notes", "type": "text"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    notes_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": "Bonjour", f"field_{notes_field_id}": "greeting"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    updated_row_list = []
+    def record_rows_updated(sender, rows, **kwargs):
+        updated_row_list.extend(rows)
+    rows_updated.connect(record_rows_updated)
+    try:
+        response = api_client.post(
+            reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+            {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+            format="json",
+            HTTP_AUTHORIZATION=f"JWT {token}",
+        )
+    finally:
+        rows_updated.disconnect(record_rows_updated)
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    # the rows sent to realtime and webhook subscribers are whole rows, with the computed value
+    assert len(updated_row_list) == 1
+    row = updated_row_list[0]
+    assert getattr(row, f'field_{notes_field_id}') == 'greeting'
+    assert json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] == 'Bonjour'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_deferred(api_client, data_fixture):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": "Bonjour"}, {f"field_{french_field_id}": "Merci"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # use up today's quota
+    quotas.get_usage_record(user.id).reserve(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
+
+    # the premium translation can't be populated, the rows are left in the ledger
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceB'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+    assert response.json()['backfill_estimate'] == {'characters': len('Bonjour') + len('Merci'), 'available_characters': 0}
+
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=english_trans_field_id)
+    assert backfill_job.status == BACKFILL_STATUS_DEFERRED
+    assert backfill_job.last_row_id == 0
+    assert backfill_job.remaining_characters == len('Bonjour') + len('Merci')
+
+    # nothing to resume until the quota is available again
+    tasks.resume_backfill_jobs()
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 1
+
+    # a few characters aren't enough to cover the remaining rows
+    quotas.get_usage_record(user.id).release(len('Bonjour'))
+    tasks.resume_backfill_jobs()
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=english_trans_field_id)
+    assert backfill_job.status == BACKFILL_STATUS_DEFERRED
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - len('Bonjour')
+
+    # the period rolls over, the job completes
+    quotas.get_usage_record(user.id).release(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS - len('Bonjour'))
+    tasks.resume_backfill_jobs()
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+
+    row_list = table.get_model().objects.order_by('id')
+    assert [json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] for row in row_list] == ['Bonjour', 'Merci']
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('Bonjour') + len('Merci')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_checkpoint(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    french_words = ['Bonjour', 'Merci', 'Oui', 'Non']
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": word} for word in french_words]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # every bucket gets handed over to a new task, which continues from the checkpoint
+    monkeypatch.setattr(tasks, 'BACKFILL_CHUNK_DURATION', 0)
+    dispatched_job_list = []
+    dispatch_backfill_job = tasks.dispatch_backfill_job
+    def record_dispatch(backfill_job):
+        dispatched_job_list.append((backfill_job.last_row_id, backfill_job.rows))
+        dispatch_backfill_job(backfill_job)
+    monkeypatch.setattr(tasks, 'dispatch_backfill_job', record_dispatch)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    row_list = list(table.get_model().objects.order_by('id'))
+    # the first bucket has a single row, the continuation goes straight to full size buckets
+    assert dispatched_job_list == [(row_list[0].id, 1), (row_list[-1].id, len(row_list))]
+    assert [json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] for row in row_list] == french_words
+    # the job is done
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_stalled_attempt(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    french_words = ['Bonjour', 'Merci', 'Oui', 'Non']
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": word} for word in french_words]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # continuations stay in the queue until the test runs them
+    monkeypatch.setattr(tasks, 'BACKFILL_CHUNK_DURATION', 0)
+    queued_signature_list = []
+    monkeypatch.setattr(tasks, 'dispatch_backfill_job', lambda backfill_job: queued_signature_list.append(tasks.get_backfill_job_signature(backfill_job)))
+    translated_text_list = []
+    get_translation = clt_interface.manager.get_translation
+    def record_translation(text, *args, **kwargs):
+        translated_text_list.append(text)
+        return get_translation(text, *args, **kwargs)
+    monkeypatch.setattr(clt_interface.manager, 'get_translation', record_translation)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+    assert translated_text_list == ['Bonjour']
+    assert len(queued_signature_list) == 1
+
+    # the continuation sits in the queue past the stalled timeout, the scheduler dispatches the job again
+    VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).update(updated_time=timezone.now() - datetime.timedelta(minutes=16))
+    tasks.resume_backfill_jobs()
+    assert len(queued_signature_list) == 2
+    assert VocabAiBackfillJob.objects.get(field_id=english_trans_field_id).attempt == 1
+
+    # the original task finally starts, it doesn't own the job anymore
+    queued_signature_list.pop(0).apply()
+    assert translated_text_list == ['Bonjour']
+    assert VocabAiBackfillJob.objects.get(field_id=english_trans_field_id).last_row_id == table.get_model().objects.order_by('id').first().id
+
+    # the new attempt completes the job, each row is translated once
+    while len(queued_signature_list) > 0:
+        queued_signature_list.pop(0).apply()
+    assert sorted(translated_text_list) == sorted(french_words)
+    row_list = table.get_model().objects.order_by('id')
+    assert [json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] for row in row_list] == french_words
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_failed(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceB'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    table.get_model().objects.create(**{f'field_{french_field_id}': 'Bonjour'})
+
+    def failing_translation(text, *args, **kwargs):
+        raise RuntimeError('service error')
+    monkeypatch.setattr(clt_interface.manager, 'get_translation', failing_translation)
+    # the task raises, whether eager tasks propagate exceptions or not
+    monkeypatch.setattr(tasks, 'dispatch_backfill_job', lambda backfill_job: tasks.get_backfill_job_signature(backfill_job).apply(throw=False))
+
+    tasks.run_clt_translation_all_rows.apply(
+        args=[table.id, 'fr', 'en', 'TestServiceB', f'field_{french_field_id}', f'field_{english_trans_field_id}', user.id], throw=False)
+
+    # the job waits for the scheduler to retry it, and the reservation was given back
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=english_trans_field_id)
+    assert (backfill_job.status, backfill_job.failures, backfill_job.reserved_characters) == (BACKFILL_STATUS_DEFERRED, 1, 0)
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 0
+
+    # it keeps failing, the scheduler gives up on it
+    for i in range(backfill_jobs.BACKFILL_MAX_FAILURES - 1):
+        tasks.resume_backfill_jobs()
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=english_trans_field_id)
+    assert (backfill_job.status, backfill_job.failures) == (BACKFILL_STATUS_FAILED, backfill_jobs.BACKFILL_MAX_FAILURES)
+    tasks.resume_backfill_jobs()
+    assert VocabAiBackfillJob.objects.get(field_id=english_trans_field_id).failures == backfill_jobs.BACKFILL_MAX_FAILURES
+
+
+@pytest.mark.django_db
+def test_backfill_stalled_failures(data_fixture):
+    user = data_fixture.create_user()
+    table = data_fixture.create_database_table(user=user)
+    field = data_fixture.create_text_field(table=table)
+    backfill_job = VocabAiBackfillJob.objects.create(field_id=field.id, task_name='test', usage_user_id=user.id)
+    stalled_time = timezone.now() - datetime.timedelta(seconds=backfill_jobs.BACKFILL_STALLED_TIMEOUT + 60)
+
+    # the worker died while holding part of the quota, the new attempt gets it back
+    quotas.get_usage_record(user.id).reserve(100)
+    backfill_jobs.store_reserved_characters(backfill_job, 100)
+    VocabAiBackfillJob.objects.filter(id=backfill_job.id).update(updated_time=stalled_time)
+    assert [stalled_job.id for stalled_job in backfill_jobs.take_stalled_backfill_jobs()] == [backfill_job.id]
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == 0
+    backfill_job.refresh_from_db()
+    assert (backfill_job.attempt, backfill_job.failures, backfill_job.reserved_characters) == (1, 1, 0)
+
+    # progress resets the count
+    assert backfill_jobs.checkpoint_backfill_job(backfill_job, 1, tasks.BackfillStats())
+    assert VocabAiBackfillJob.objects.get(id=backfill_job.id).failures == 0
+
+    # a job which stalls again and again is marked failed, rather than dispatched forever
+    for i in range(backfill_jobs.BACKFILL_MAX_FAILURES - 1):
+        VocabAiBackfillJob.objects.filter(id=backfill_job.id).update(updated_time=stalled_time)
+        assert len(backfill_jobs.take_stalled_backfill_jobs()) == 1
+    VocabAiBackfillJob.objects.filter(id=backfill_job.id).update(updated_time=stalled_time)
+    assert backfill_jobs.take_stalled_backfill_jobs() == []
+    assert VocabAiBackfillJob.objects.get(id=backfill_job.id).status == BACKFILL_STATUS_FAILED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_sharded(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    french_words = ['Bonjour', 'Merci', 'Oui', 'Non', 'Salut']
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": word} for word in french_words]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    monkeypatch.setattr(tasks, 'BACKFILL_SHARD_COUNT', 2)
+    monkeypatch.setattr(tasks, 'BACKFILL_SHARD_MIN_ROWS', 2)
+    row_id_list = list(table.get_model().objects.order_by('id').values_list('id', flat=True))
+    assert tasks.get_shard_row_ranges(table.id) == [(0, row_id_list[1]), (row_id_list[1], row_id_list[-1])]
+
+    table_refresh_list = []
+    def table_updated_receiver(sender, table, user, force_table_refresh=False, **kwargs):
+        table_refresh_list.append(force_table_refresh)
+    table_updated.connect(table_updated_receiver)
+    try:
+        response = api_client.post(
+            reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+            {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+            format="json",
+            HTTP_AUTHORIZATION=f"JWT {token}",
+        )
+    finally:
+        table_updated.disconnect(table_updated_receiver)
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    row_list = list(table.get_model().objects.order_by('id'))
+    assert [json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] for row in row_list] == french_words
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+    # a single refresh once all shards are done
+    assert table_refresh_list == [True]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_supersede(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    update_all_rows_list = []
+    monkeypatch.setattr(TranslationFieldType, 'update_all_rows', lambda self, field: update_all_rows_list.append(field.id))
+
+    # renaming doesn't change the translations
+    response = api_client.patch(
+        reverse("api:database:fields:item", kwargs={"field_id": english_trans_field_id}),
+        {"name": "english"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert update_all_rows_list == []
+
+    # changing the target language does
+    response = api_client.patch(
+        reverse("api:database:fields:item", kwargs={"field_id": english_trans_field_id}),
+        {"target_language": "de"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert update_all_rows_list == [english_trans_field_id]
+
+    # an in-flight backfill stops at its next checkpoint once the field is trashed
+    backfill_job = VocabAiBackfillJob.objects.create(field_id=english_trans_field_id, task_name='test', usage_user_id=user.id)
+    assert backfill_jobs.checkpoint_backfill_job(backfill_job, 1, tasks.BackfillStats())
+    response = api_client.delete(
+        reverse("api:database:fields:item", kwargs={"field_id": english_trans_field_id}),
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert not backfill_jobs.checkpoint_backfill_job(backfill_job, 2, tasks.BackfillStats())
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_merged(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    source_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{source_field_id}": "Bonjour"}, {f"field_{source_field_id}": "Merci"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+
+    # both fields get created before the dispatcher of the table runs
+    dispatch_table_id_list = []
+    monkeypatch.setattr(tasks, 'dispatch_scheduled_backfills_later', lambda table_id: dispatch_table_id_list.append(table_id))
+    target_field_id_list = []
+    for target_language in ['en', 'de']:
+        response = api_client.post(
+            reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+            {"name": f"{target_language}_trans", "type": "translation", "source_field_id": source_field_id, 'target_language': target_language, 'service': 'TestServiceA'},
+            format="json",
+            HTTP_AUTHORIZATION=f"JWT {token}",
+        )
+        assert response.status_code == HTTP_200_OK
+        target_field_id_list.append(response.json()['id'])
+    assert dispatch_table_id_list == [table.id, table.id]
+
+    pass_list = []
+    iterate_row_id_buckets = tasks.iterate_row_id_buckets
+    def record_pass(table_model, *args, **kwargs):
+        pass_list.append(sorted(field['field'].id for field in table_model._field_objects.values()))
+        return iterate_row_id_buckets(table_model, *args, **kwargs)
+    monkeypatch.setattr(tasks, 'iterate_row_id_buckets', record_pass)
+
+    # the first dispatch computes both translations in one pass over the table, the second one has nothing left to do
+    tasks.dispatch_scheduled_backfills(table.id)
+    tasks.dispatch_scheduled_backfills(table.id)
+    assert pass_list == [sorted([source_field_id] + target_field_id_list)]
+    assert VocabAiBackfillJob.objects.count() == 0
+
+    model = table.get_model()
+    for row in model.objects.all():
+        for target_field_id, target_language in zip(target_field_id_list, ['en', 'de']):
+            assert json.loads(getattr(row, f'field_{target_field_id}'))['to_language_key'] == target_language
+
+
+@pytest.mark.django_db(transaction=True)
+def test_schedule_backfill_rollback(data_fixture, monkeypatch):
+    user = data_fixture.create_user()
+    table = data_fixture.create_database_table(user=user)
+    source_field = data_fixture.create_text_field(table=table, name='source')
+    field = data_fixture.create_text_field(table=table, name='target')
+    translation_field = TranslationField(id=field.id, table_id=table.id, source_field_id=source_field.id)
+
+    dispatch_table_id_list = []
+    monkeypatch.setattr(tasks, 'dispatch_scheduled_backfills_later', lambda table_id: dispatch_table_id_list.append(table_id))
+
+    # the backfill scheduled in a rolled back transaction leaves nothing behind
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            tasks.schedule_backfill(translation_field, user.id, tasks.run_clt_translation_all_rows, (table.id,), {})
+            raise RuntimeError('rollback')
+    assert dispatch_table_id_list == []
+    assert VocabAiBackfillJob.objects.count() == 0
+
+    # a committed one waits in the ledger for the dispatcher of its table
+    with transaction.atomic():
+        tasks.schedule_backfill(translation_field, user.id, tasks.run_clt_translation_all_rows, (table.id,), {'estimated_characters': 10})
+        assert dispatch_table_id_list == []
+    assert dispatch_table_id_list == [table.id]
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=field.id)
+    assert (backfill_job.status, backfill_job.task_args, backfill_job.task_kwargs) == (BACKFILL_STATUS_SCHEDULED, [table.id], {})
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cell_fingerprints(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": "Bonjour"}, {f"field_{french_field_id}": "Merci"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    row_id_list = [row['id'] for row in response.json()['items']]
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+    assert VocabAiCellFingerprint.objects.filter(field_id=english_trans_field_id).count() == 2
+
+    translated_text_list = []
+    get_translation_batch = clt_interface.get_translation_batch
+    def record_translation_batch(texts, *args, **kwargs):
+        translated_text_list.extend(texts)
+        return get_translation_batch(texts, *args, **kwargs)
+    monkeypatch.setattr(clt_interface, 'get_translation_batch', record_translation_batch)
+
+    # recomputing all rows with the same settings doesn't translate anything
+    english_trans_field = TranslationField.objects.get(id=english_trans_field_id)
+    TranslationFieldType().update_all_rows(english_trans_field)
+    assert translated_text_list == []
+
+    # only the edited row gets translated
+    response = api_client.patch(
+        reverse("api:database:rows:item", kwargs={"table_id": table.id, "row_id": row_id_list[0]}),
+        {f"field_{french_field_id}": "Salut"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert translated_text_list == ['Salut']
+
+    # different settings recompute everything
+    english_trans_field.target_language = 'de'
+    english_trans_field.save()
+    TranslationFieldType().update_all_rows(english_trans_field)
+    assert sorted(translated_text_list) == ['Merci', 'Salut', 'Salut']
+
+    # a cell which was cleared is computed again, even though its source value is the same
+    translated_text_list.clear()
+    table.get_model().objects.filter(id=row_id_list[0]).update(**{f'field_{english_trans_field_id}': ''})
+    response = api_client.patch(
+        reverse("api:database:rows:item", kwargs={"table_id": table.id, "row_id": row_id_list[0]}),
+        {f"field_{french_field_id}": "Salut"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert translated_text_list == ['Salut']
+    assert json.loads(response.json()[f'field_{english_trans_field_id}'])['text'] == 'Salut'
+
+    # deleting a row drops its fingerprints
+    response = api_client.delete(
+        reverse("api:database:rows:item", kwargs={"table_id": table.id, "row_id": row_id_list[1]}),
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_204_NO_CONTENT
+    assert list(VocabAiCellFingerprint.objects.filter(field_id=english_trans_field_id).values_list('row_id', flat=True)) == [row_id_list[0]]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_fill_missing(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": "Bonjour"}, {f"field_{french_field_id}": "Merci"}, {f"field_{french_field_id}": ""}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    row_id_list = [row['id'] for row in response.json()['items']]
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    # the second row loses its value, its fingerprint is still there
+    model = table.get_model()
+    model.objects.filter(id=row_id_list[1]).update(**{f'field_{english_trans_field_id}': None})
+    assert VocabAiCellFingerprint.objects.filter(field_id=english_trans_field_id, row_id=row_id_list[1]).count() == 1
+
+    translated_text_list = []
+    get_translation_batch = clt_interface.get_translation_batch
+    def record_translation_batch(texts, *args, **kwargs):
+        translated_text_list.extend(texts)
+        return get_translation_batch(texts, *args, **kwargs)
+    monkeypatch.setattr(clt_interface, 'get_translation_batch', record_translation_batch)
+
+    response = api_client.patch(
+        reverse("api:database:fields:item", kwargs={"field_id": english_trans_field_id}),
+        {"fill_missing": True},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert 'fill_missing' not in response.json()
+    # only the row with a source and without a value is translated, and only it is counted in the estimate
+    assert translated_text_list == ['Merci']
+    assert response.json()['backfill_estimate']['characters'] > 0
+
+    row = model.objects.get(id=row_id_list[1])
+    assert len(getattr(row, f'field_{english_trans_field_id}')) > 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_backfill_fill_missing_romanization(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "chinese", "type": "language_text", "language": cloudlanguagetools.languages.Language.zh_cn.name},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    chinese_field_id = response.json()['id']
+
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{chinese_field_id}": "老人家"}, {f"field_{chinese_field_id}": "你好"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    row_id_list = [row['id'] for row in response.json()['items']]
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "pinyin", "type": "chinese_romanization", "source_field_id": chinese_field_id, 'transformation': 'pinyin', 'tone_numbers': False, 'spaces': False},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    pinyin_field_id = response.json()['id']
+
+    # the second row is back to the default of the json field, an empty object
+    model = table.get_model()
+    model.objects.filter(id=row_id_list[1]).update(**{f'field_{pinyin_field_id}': {}})
+
+    romanized_text_list = []
+    get_pinyin = clt_interface.get_pinyin
+    def record_pinyin(text, *args, **kwargs):
+        romanized_text_list.append(text)
+        return get_pinyin(text, *args, **kwargs)
+    monkeypatch.setattr(clt_interface, 'get_pinyin', record_pinyin)
+
+    response = api_client.patch(
+        reverse("api:database:fields:item", kwargs={"field_id": pinyin_field_id}),
+        {"fill_missing": True},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    # the empty object counts as missing, the populated row is left alone
+    assert romanized_text_list == ['你好']
+    row = model.objects.get(id=row_id_list[1])
+    assert getattr(row, f'field_{pinyin_field_id}') not in [None, {}]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_row_updates(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+    monkeypatch.setattr(vocabai_fieldtypes, 'ASYNC_ROW_UPDATES', True)
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "chinese", "type": "language_text", "language": cloudlanguagetools.languages.Language.zh_cn.name},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    chinese_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": chinese_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "pinyin", "type": "chinese_romanization", "source_field_id": chinese_field_id, 'transformation': 'pinyin', 'tone_numbers': False, 'spaces': False},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    pinyin_field_id = response.json()['id']
+
+    updated_row_list = []
+    def record_rows_updated(sender, rows, **kwargs):
+        updated_row_list.extend(rows)
+    rows_updated.connect(record_rows_updated)
+
+    try:
+        response = api_client.post(
+            reverse("api:database:rows:list", kwargs={"table_id": table.id}),
+            {f"field_{chinese_field_id}": "老人家"},
+            format="json",
+            HTTP_AUTHORIZATION=f"JWT {token}",
+        )
+        assert response.status_code == HTTP_200_OK
+        row_id = response.json()['id']
+        # the translation is pending when the request returns, the local romanization is computed inline
+        assert response.json()[f'field_{english_trans_field_id}'] == None
+        assert response.json()[f'field_{pinyin_field_id}'] != None
+    finally:
+        rows_updated.disconnect(record_rows_updated)
+
+    # the task has computed the translation once the row was committed, and pushed it to the frontend
+    row = table.get_model().objects.get(id=row_id)
+    assert len(getattr(row, f'field_{english_trans_field_id}')) > 0
+    assert row_id in [row.id for row in updated_row_list]
+    assert VocabAiCellFingerprint.objects.filter(field_id=english_trans_field_id, row_id=row_id).count() == 1
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_row_updates_deferred(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+    monkeypatch.setattr(vocabai_fieldtypes, 'ASYNC_ROW_UPDATES', True)
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceB'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    # use up today's quota
+    quotas.get_usage_record(user.id).reserve(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
+
+    response = api_client.post(
+        reverse("api:database:rows:list", kwargs={"table_id": table.id}),
+        {f"field_{french_field_id}": "Bonjour"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    row_id = response.json()['id']
+
+    # the task couldn't compute the row, it is left to a deferred job
+    row = table.get_model().objects.get(id=row_id)
+    assert getattr(row, f'field_{english_trans_field_id}') == None
+    backfill_job = VocabAiBackfillJob.objects.get(field_id=english_trans_field_id)
+    assert backfill_job.status == BACKFILL_STATUS_DEFERRED
+    assert backfill_job.task_args == [english_trans_field_id, [row_id]]
+    assert backfill_job.remaining_characters == len('Bonjour')
+    # a fill missing backfill leaves the row to its job
+    row_queryset = tasks.get_backfill_row_queryset(table.get_model(), f'field_{french_field_id}', f'field_{english_trans_field_id}', fill_missing=True)
+    assert list(row_queryset) == []
+    # the job says which rows are pending, not the empty cell
+    table.get_model().objects.filter(id=row_id).update(**{f'field_{english_trans_field_id}': 'stale'})
+
+    # the period rolls over, the row gets computed
+    quotas.get_usage_record(user.id).release(quotas.FREE_ACCOUNT_DAILY_MAX_CHARACTERS)
+    tasks.resume_backfill_jobs()
+    assert VocabAiBackfillJob.objects.filter(field_id=english_trans_field_id).count() == 0
+    row = table.get_model().objects.get(id=row_id)
+    assert json.loads(getattr(row, f'field_{english_trans_field_id}'))['text'] == 'Bonjour'
+    assert quotas.get_usage_record(user.id).daily_usage_record.characters == len('Bonjour')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_create_rows_async(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+    monkeypatch.setattr(vocabai_fieldtypes, 'ASYNC_ROW_UPDATE_THRESHOLD', 2)
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "english_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': 'en', 'service': 'TestServiceA'},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    english_trans_field_id = response.json()['id']
+
+    # two distinct values are computed inline
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": "Bonjour"}, {f"field_{french_field_id}": "Merci"}, {f"field_{french_field_id}": "Merci"}]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert all(item[f'field_{english_trans_field_id}'] != None for item in response.json()['items'])
+
+    # above the threshold, the rows are handed off to the celery task
+    french_text_list = ['Oui', 'Non', 'Peut-être']
+    response = api_client.post(
+        f'/api/database/rows/table/{table.id}/batch/',
+        {'items': [{f"field_{french_field_id}": text} for text in french_text_list]},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert all(item[f'field_{english_trans_field_id}'] == None for item in response.json()['items'])
+    row_id_list = [item['id'] for item in response.json()['items']]
+
+    model = table.get_model()
+    for row_id, text in zip(row_id_list, french_text_list):
+        row = model.objects.get(id=row_id)
+        assert json.loads(getattr(row, f'field_{english_trans_field_id}')) == {
+            "text": text, "from_language_key": "fr", "to_language_key": 'en'
+        }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sibling_translations(api_client, data_fixture, monkeypatch):
+    use_clt_test_services()
+
+    user, token = data_fixture.create_user_and_token()
+    clt_interface.update_language_data()
+
+    table = data_fixture.create_database_table(user=user)
+
+    response = api_client.post(
+        reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+        {"name": "french", "type": "language_text", "language": "fr"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    french_field_id = response.json()['id']
+
+    target_field_id_list = []
+    for target_language in ['en', 'de']:
+        response = api_client.post(
+            reverse("api:database:fields:list", kwargs={"table_id": table.id}),
+            {"name": f"{target_language}_trans", "type": "translation", "source_field_id": french_field_id, 'target_language': target_language, 'service': 'TestServiceA'},
+            format="json",
+            HTTP_AUTHORIZATION=f"JWT {token}",
+        )
+        assert response.status_code == HTTP_200_OK
+        target_field_id_list.append(response.json()['id'])
+
+    target_languages_list = []
+    get_translation_batch_multi_target = clt_interface.get_translation_batch_multi_target
+    def record_translation_batch_multi_target(texts, source_language, target_languages, *args, **kwargs):
+        target_languages_list.append(sorted(target_languages))
+        return get_translation_batch_multi_target(texts, source_language, target_languages, *args, **kwargs)
+    monkeypatch.setattr(clt_interface, 'get_translation_batch_multi_target', record_translation_batch_multi_target)
+
+    # one call for both translations
+    response = api_client.post(
+        reverse("api:database:rows:list", kwargs={"table_id": table.id}),
+        {f"field_{french_field_id}": "Bonjour"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert target_languages_list == [['de', 'en']]
+
+    for target_field_id, target_language in zip(target_field_id_list, ['en', 'de']):
+        assert json.loads(response.json()[f'field_{target_field_id}']) == {
+            "text": "Bonjour", "from_language_key": "fr", "to_language_key": target_language
+        }
+    row_id = response.json()['id']
+
+    # a sibling which is up to date isn't translated again
+    target_languages_list.clear()
+    VocabAiCellFingerprint.objects.filter(field_id=target_field_id_list[0], row_id=row_id).delete()
+    response = api_client.patch(
+        reverse("api:database:rows:item", kwargs={"table_id": table.id, "row_id": row_id}),
+        {f"field_{french_field_id}": "Bonjour"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert target_languages_list == [['en']]
+
+    # when the combined call fails, each field falls back to its own translation
+    target_languages_list.clear()
+    def failing_translation_batch_multi_target(texts, source_language, target_languages, *args, **kwargs):
+        target_languages_list.append(sorted(target_languages))
+        if len(target_languages) > 1:
+            raise RuntimeError('service error')
+        return get_translation_batch_multi_target(texts, source_language, target_languages, *args, **kwargs)
+    monkeypatch.setattr(clt_interface, 'get_translation_batch_multi_target', failing_translation_batch_multi_target)
+    response = api_client.post(
+        reverse("api:database:rows:list", kwargs={"table_id": table.id}),
+        {f"field_{french_field_id}": "Merci"},
+        format="json",
+        HTTP_AUTHORIZATION=f"JWT {token}",
+    )
+    assert response.status_code == HTTP_200_OK
+    assert sorted(target_languages_list) == [['de'], ['de', 'en'], ['en']]
+    for target_field_id, target_language in zip(target_field_id_list, ['en', 'de']):
+        assert json.loads(response.json()[f'field_{target_field_id}'])['to_language_key'] == target_language
+
+
 @pytest.mark.django_db(transaction=True)
 def test_pinyin(api_client, data_fixture):
     use_clt_real_services()
@@ -500,7 +2063,7 @@ def test_create_multiple_rows(api_client, data_fixture):
 
     response = api_client.get(reverse('api:baserow_vocabai_plugin:translation-options'),HTTP_AUTHORIZATION=f"JWT {token}",)
     assert response.status_code == HTTP_200_OK
-    pprint.pprint(response.data)    
+    pprint.pprint(response.json())    
 
     # create database
     # ===============
@@ -12,6 +12,12 @@ export default (client) => {
     fetchAllDictionaryLookupOptions() {
       return client.get(`/baserow_vocabai_plugin/dictionary_lookup_options/`)
     },            
+    fetchTransliterationOptionsForLanguage(language, params = {}) {
+      return client.get(`/baserow_vocabai_plugin/transliteration_options/${language}/`, { params })
+    },
+    fetchDictionaryLookupOptionsForLanguage(language, params = {}) {
+      return client.get(`/baserow_vocabai_plugin/dictionary_lookup_options/${language}/`, { params })
+    },
     fetchTranslationServices(source_language, target_language) {
       return client.get(`/baserow_vocabai_plugin/translation_services/${source_language}/${target_language}`)
     },        
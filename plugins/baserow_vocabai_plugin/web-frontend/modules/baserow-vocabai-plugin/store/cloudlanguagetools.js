@@ -6,6 +6,9 @@ export const state = () => ({
   allTransliterationOptions: [],
   allTranslationServices: [],
   allDictionaryLookupOptions: [],
+  // options are loaded per language, when a source field is selected
+  transliterationOptionsByLanguage: {},
+  dictionaryLookupOptionsByLanguage: {},
 })
 
 export const mutations = {
@@ -24,6 +27,12 @@ export const mutations = {
   SET_ALL_TRANSLATION_SERVICES(state, allTranslationServices) {
     state.allTranslationServices = allTranslationServices;
   },  
+  SET_TRANSLITERATION_OPTIONS_FOR_LANGUAGE(state, { language, options }) {
+    state.transliterationOptionsByLanguage = { ...state.transliterationOptionsByLanguage, [language]: options };
+  },
+  SET_DICTIONARY_LOOKUP_OPTIONS_FOR_LANGUAGE(state, { language, options }) {
+    state.dictionaryLookupOptionsByLanguage = { ...state.dictionaryLookupOptionsByLanguage, [language]: options };
+  },
 }
 
 export const actions = {
@@ -32,8 +41,8 @@ export const actions = {
     console.log('store/cloudlanguagetools fetchAll');
     await dispatch('fetchAllLanguages');
     await dispatch('fetchAllTranslationOptions');
-    await dispatch('fetchAllTransliterationOptions');
-    await dispatch('fetchAllDictionaryLookupOptions');
+    // transliteration and dictionary lookup options are fetched per language, see
+    // fetchTransliterationOptionsForLanguage and fetchDictionaryLookupOptionsForLanguage
   },
 
   async fetchAllLanguages({ commit, getters, dispatch }, table) {
@@ -94,6 +103,22 @@ export const actions = {
   },    
 
 
+  async fetchTransliterationOptionsForLanguage({ commit, getters, state }, language) {
+    if (language in state.transliterationOptionsByLanguage) {
+      return;
+    }
+    const { data } = await CloudLanguageToolsService(this.$client).fetchTransliterationOptionsForLanguage(language);
+    commit('SET_TRANSLITERATION_OPTIONS_FOR_LANGUAGE', { language, options: data.results });
+  },
+
+  async fetchDictionaryLookupOptionsForLanguage({ commit, getters, state }, language) {
+    if (language in state.dictionaryLookupOptionsByLanguage) {
+      return;
+    }
+    const { data } = await CloudLanguageToolsService(this.$client).fetchDictionaryLookupOptionsForLanguage(language);
+    commit('SET_DICTIONARY_LOOKUP_OPTIONS_FOR_LANGUAGE', { language, options: data.results });
+  },
+
 }
 
 export const getters = {
@@ -120,11 +145,11 @@ export const getters = {
       },    
 
       transliterationOptionsForLanguage: (state) => (language) => {
-        return state.allTransliterationOptions.filter((entry) => entry['language_code'] == language);
+        return state.transliterationOptionsByLanguage[language] || [];
       },
 
       dictionaryLookupOptionsForLanguage: (state) => (language) => {
-        return state.allDictionaryLookupOptions.filter((entry) => entry['language_code'] == language);
+        return state.dictionaryLookupOptionsByLanguage[language] || [];
       },      
 }
 